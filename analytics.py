@@ -1,11 +1,53 @@
+import atexit
 import logging
-from datetime import datetime, timedelta
-from sqlalchemy import func
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from sqlalchemy import func, select
 from app import app, db
-from models import User, Message, AIRequest, FileProcessing, BotStats, Group
+from models import User, Message, MessageDailyCount, AIRequest, FileProcessing, BotStats, Group, insert_on_conflict
 
 logger = logging.getLogger(__name__)
 
+# Dashboard stats cache (in-memory, refreshed at most once per TTL)
+_DASHBOARD_TTL = float(os.environ.get("DASHBOARD_TTL", "30"))
+_dashboard_cache = {"ts": 0.0, "value": None}
+_dashboard_lock = threading.Lock()
+
+# Admin panel/stats snapshot lifetime
+_SNAPSHOT_TTL = 30
+
+# Live command frequency counter over the known commands, seeded from the messages table on first use
+_command_counts = Counter()
+_command_counts_loaded = False
+_command_counts_lock = threading.Lock()
+
+# Width of the BotStats.metric_name column
+_MAX_METRIC_NAME = 100
+
+@lru_cache(maxsize=1)
+def _dashboard_snapshot(bucket: int) -> dict:
+    """Build the admin snapshot; the bucket argument expires it every _SNAPSHOT_TTL seconds"""
+    snapshot = Analytics.get_scalar_counters(7)
+    snapshot['popular_commands'] = Analytics.get_popular_commands(5)
+    return snapshot
+
+def _count_subquery(model, *criteria):
+    """Build a scalar COUNT(*) subquery for a model"""
+    return select(func.count()).select_from(model).where(*criteria).scalar_subquery()
+
+# Core COUNT(*) statements for the read-only analytics path (no ORM Query/entities)
+_COUNT_USERS = select(func.count()).select_from(User.__table__)
+_COUNT_MESSAGES = select(func.count()).select_from(Message.__table__)
+_COUNT_COMMANDS = select(func.count()).select_from(Message.__table__).where(Message.__table__.c.is_command == True)
+_COUNT_AI_REQUESTS = select(func.count()).select_from(AIRequest.__table__)
+_COUNT_FILES = select(func.count()).select_from(FileProcessing.__table__)
+_COUNT_ACTIVE_GROUPS = select(func.count()).select_from(Group.__table__).where(Group.__table__.c.is_active == True)
+
 class Analytics:
     """Analytics service for bot statistics"""
     
@@ -13,7 +55,7 @@ class Analytics:
     def get_total_users() -> int:
         """Get total number of users"""
         try:
-            return User.query.count()
+            return db.session.execute(_COUNT_USERS).scalar()
         except Exception as e:
             logger.error(f"Error getting total users: {e}")
             return 0
@@ -22,7 +64,7 @@ class Analytics:
     def get_total_messages() -> int:
         """Get total number of messages"""
         try:
-            return Message.query.count()
+            return db.session.execute(_COUNT_MESSAGES).scalar()
         except Exception as e:
             logger.error(f"Error getting total messages: {e}")
             return 0
@@ -32,7 +74,7 @@ class Analytics:
         """Get number of active users in last N days"""
         try:
             cutoff_date = datetime.utcnow() - timedelta(days=days)
-            return User.query.filter(User.last_seen >= cutoff_date).count()
+            return db.session.execute(_COUNT_USERS.where(User.__table__.c.last_seen >= cutoff_date)).scalar()
         except Exception as e:
             logger.error(f"Error getting active users: {e}")
             return 0
@@ -41,7 +83,7 @@ class Analytics:
     def get_commands_used() -> int:
         """Get total number of commands used"""
         try:
-            return Message.query.filter(Message.is_command == True).count()
+            return db.session.execute(_COUNT_COMMANDS).scalar()
         except Exception as e:
             logger.error(f"Error getting commands used: {e}")
             return 0
@@ -50,7 +92,7 @@ class Analytics:
     def get_ai_requests() -> int:
         """Get total number of AI requests"""
         try:
-            return AIRequest.query.count()
+            return db.session.execute(_COUNT_AI_REQUESTS).scalar()
         except Exception as e:
             logger.error(f"Error getting AI requests: {e}")
             return 0
@@ -59,7 +101,7 @@ class Analytics:
     def get_files_processed() -> int:
         """Get total number of files processed"""
         try:
-            return FileProcessing.query.count()
+            return db.session.execute(_COUNT_FILES).scalar()
         except Exception as e:
             logger.error(f"Error getting files processed: {e}")
             return 0
@@ -68,7 +110,7 @@ class Analytics:
     def get_active_groups() -> int:
         """Get number of active groups"""
         try:
-            return Group.query.filter(Group.is_active == True).count()
+            return db.session.execute(_COUNT_ACTIVE_GROUPS).scalar()
         except Exception as e:
             logger.error(f"Error getting active groups: {e}")
             return 0
@@ -77,11 +119,9 @@ class Analytics:
     def get_bot_uptime() -> str:
         """Get bot uptime"""
         try:
-            start_time = app.config.get('BOT_START_TIME', datetime.now())
-            uptime = datetime.now() - start_time
-            
-            days = uptime.days
-            hours, remainder = divmod(uptime.seconds, 3600)
+            seconds = int(time.monotonic() - app.config.get('BOT_START_MONO', time.monotonic()))
+            days, remainder = divmod(seconds, 86400)
+            hours, remainder = divmod(remainder, 3600)
             minutes, seconds = divmod(remainder, 60)
             
             if days > 0:
@@ -94,42 +134,123 @@ class Analytics:
             logger.error(f"Error getting uptime: {e}")
             return "Unknown"
     
+    @staticmethod
+    def get_scalar_counters(active_days: int = 7) -> dict:
+        """Get all scalar dashboard counters in a single round-trip"""
+        now = datetime.utcnow()
+        cutoff_date = now - timedelta(days=active_days)
+        row = db.session.execute(select(
+            _count_subquery(User).label('total_users'),
+            _count_subquery(User, User.last_seen >= cutoff_date).label('active_users'),
+            _count_subquery(User, User.last_seen >= now - timedelta(hours=24)).label('active_users_24h'),
+            _count_subquery(User, User.is_admin == True).label('admins'),
+            _count_subquery(User, User.is_banned == True).label('banned'),
+            _count_subquery(Message).label('total_messages'),
+            _count_subquery(Message, Message.is_command == True).label('commands_used'),
+            _count_subquery(AIRequest).label('ai_requests'),
+            _count_subquery(FileProcessing).label('files_processed'),
+            _count_subquery(Group, Group.is_active == True).label('active_groups')
+        )).one()
+        
+        return dict(row._mapping)
+    
+    @staticmethod
+    def load_command_counts() -> None:
+        """Seed the in-memory command counter from the messages table"""
+        global _command_counts_loaded
+        if _command_counts_loaded:
+            return
+        
+        from bot import KNOWN_COMMANDS
+        # Held across the query so no record_command increment lands before the seed
+        with _command_counts_lock:
+            if _command_counts_loaded:
+                return
+            
+            result = db.session.execute(
+                select(Message.command_name, func.count())
+                .where(Message.is_command == True, Message.command_name.in_(KNOWN_COMMANDS))
+                .group_by(Message.command_name)
+            ).all()
+            
+            _command_counts.update(dict(result))
+            _command_counts_loaded = True
+    
+    @staticmethod
+    def record_command(command_name: str) -> None:
+        """Count a logged command towards the popular commands ranking (known commands only)"""
+        with _command_counts_lock:
+            # Until seeded, the database is the source of truth
+            if _command_counts_loaded:
+                _command_counts[command_name] += 1
+    
+    @staticmethod
+    def get_dashboard_snapshot() -> dict:
+        """Get counters and popular commands for admin views (cached for _SNAPSHOT_TTL seconds)"""
+        return _dashboard_snapshot(int(time.time() // _SNAPSHOT_TTL))
+    
     @staticmethod
     def get_popular_commands(limit: int = 10) -> list:
         """Get most popular commands"""
         try:
-            result = db.session.query(
-                Message.command_name,
-                func.count(Message.id).label('count')
-            ).filter(
-                Message.is_command == True,
-                Message.command_name.isnot(None)
-            ).group_by(
-                Message.command_name
-            ).order_by(
-                func.count(Message.id).desc()
-            ).limit(limit).all()
+            Analytics.load_command_counts()
+            with _command_counts_lock:
+                top = _command_counts.most_common(limit)
             
-            return [{'command': row.command_name, 'count': row.count} for row in result]
+            return [{'command': command, 'count': count} for command, count in top]
         except Exception as e:
             logger.error(f"Error getting popular commands: {e}")
             return []
     
+    @staticmethod
+    def increment_daily_messages(day=None, count: int = 1) -> None:
+        """Add messages to the daily rollup (joins the caller's transaction)"""
+        day = day or datetime.utcnow().date()
+        stmt = insert_on_conflict(MessageDailyCount).values(date=day, count=count)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[MessageDailyCount.date],
+            set_={'count': MessageDailyCount.count + count}
+        )
+        db.session.execute(stmt)
+    
+    @staticmethod
+    def backfill_daily_messages() -> None:
+        """Populate the daily rollup from the messages table if it is empty"""
+        try:
+            if db.session.query(MessageDailyCount.date).first() is not None:
+                return
+            
+            day = func.date(Message.created_at)
+            result = db.session.execute(
+                select(day, func.count()).group_by(day)
+            ).all()
+            
+            # SQLite returns DATE() as a string, Postgres as a date
+            rows = [
+                {'date': date.fromisoformat(str(day_value)), 'count': count}
+                for day_value, count in result if day_value is not None
+            ]
+            if rows:
+                db.session.execute(MessageDailyCount.__table__.insert(), rows)
+            db.session.commit()
+            logger.info("Backfilled daily message counts for %d days", len(rows))
+        except Exception as e:
+            logger.error(f"Error backfilling daily messages: {e}")
+            db.session.rollback()
+    
     @staticmethod
     def get_daily_messages(days: int = 30) -> list:
         """Get daily message counts"""
         try:
-            cutoff_date = datetime.utcnow() - timedelta(days=days)
+            cutoff_date = (datetime.utcnow() - timedelta(days=days)).date()
             
             result = db.session.query(
-                func.date(Message.created_at).label('date'),
-                func.count(Message.id).label('count')
+                MessageDailyCount.date,
+                MessageDailyCount.count
             ).filter(
-                Message.created_at >= cutoff_date
-            ).group_by(
-                func.date(Message.created_at)
+                MessageDailyCount.date >= cutoff_date
             ).order_by(
-                func.date(Message.created_at)
+                MessageDailyCount.date
             ).all()
             
             return [{'date': row.date.isoformat(), 'count': row.count} for row in result]
@@ -141,17 +262,15 @@ class Analytics:
     def get_user_stats() -> dict:
         """Get user statistics"""
         try:
-            total_users = Analytics.get_total_users()
-            active_users = Analytics.get_active_users(7)
-            admin_users = User.query.filter(User.is_admin == True).count()
-            banned_users = User.query.filter(User.is_banned == True).count()
+            cutoff_date = datetime.utcnow() - timedelta(days=7)
+            row = db.session.execute(select(
+                func.count().label('total'),
+                func.count().filter(User.last_seen >= cutoff_date).label('active_7d'),
+                func.count().filter(User.is_admin == True).label('admins'),
+                func.count().filter(User.is_banned == True).label('banned')
+            ).select_from(User)).one()
             
-            return {
-                'total': total_users,
-                'active_7d': active_users,
-                'admins': admin_users,
-                'banned': banned_users
-            }
+            return dict(row._mapping)
         except Exception as e:
             logger.error(f"Error getting user stats: {e}")
             return {'total': 0, 'active_7d': 0, 'admins': 0, 'banned': 0}
@@ -160,14 +279,11 @@ class Analytics:
     def get_message_type_stats() -> dict:
         """Get message type statistics"""
         try:
-            result = db.session.query(
-                Message.message_type,
-                func.count(Message.id).label('count')
-            ).group_by(
-                Message.message_type
+            result = db.session.execute(
+                select(Message.message_type, func.count()).group_by(Message.message_type)
             ).all()
             
-            return {row.message_type: row.count for row in result}
+            return dict(result)
         except Exception as e:
             logger.error(f"Error getting message type stats: {e}")
             return {}
@@ -179,63 +295,187 @@ class Analytics:
             today = datetime.utcnow().date()
             
             # Check if stats for today already exist
-            existing = BotStats.query.filter_by(date=today).first()
-            if existing:
+            if db.session.query(BotStats.id).filter_by(date=today).first() is not None:
                 return
             
             # Record daily stats
-            stats = [
-                BotStats(metric_name='total_users', metric_value=Analytics.get_total_users(), date=today),
-                BotStats(metric_name='total_messages', metric_value=Analytics.get_total_messages(), date=today),
-                BotStats(metric_name='ai_requests', metric_value=Analytics.get_ai_requests(), date=today),
-                BotStats(metric_name='files_processed', metric_value=Analytics.get_files_processed(), date=today),
-                BotStats(metric_name='active_groups', metric_value=Analytics.get_active_groups(), date=today),
+            counters = Analytics.get_scalar_counters()
+            rows = [
+                {'metric_name': name, 'metric_value': counters[name], 'date': today}
+                for name in ('total_users', 'total_messages', 'ai_requests', 'files_processed', 'active_groups')
             ]
             
-            for stat in stats:
-                db.session.add(stat)
+            # Snapshot the command frequency counter
+            rows.extend(
+                {'metric_name': f"command:{cmd['command']}"[:_MAX_METRIC_NAME], 'metric_value': cmd['count'], 'date': today}
+                for cmd in Analytics.get_popular_commands(10)
+            )
             
+            db.session.execute(BotStats.__table__.insert(), rows)
             db.session.commit()
-            logger.info(f"Daily stats recorded for {today}")
+            logger.info("Daily stats recorded for %s", today)
             
         except Exception as e:
             logger.error(f"Error recording daily stats: {e}")
             db.session.rollback()
 
+# Background log writer: batches Message/AIRequest/FileProcessing rows into multi-row INSERTs
+_LOG_BATCH_SIZE = 500
+_LOG_FLUSH_INTERVAL = 0.1
+_log_queue: "queue.Queue[tuple]" = queue.Queue()
+_log_writer_thread = None
+_log_writer_lock = threading.Lock()
+
+def queue_log_row(model, row: dict) -> None:
+    """Queue a row for the background batch writer"""
+    global _log_writer_thread
+    if _log_writer_thread is None:
+        with _log_writer_lock:
+            if _log_writer_thread is None:
+                _log_writer_thread = threading.Thread(
+                    target=_log_writer, name="log-writer", daemon=True
+                )
+                _log_writer_thread.start()
+    _log_queue.put((model, row))
+
+def queue_message_log(row: dict) -> None:
+    """Queue a Message row for the background batch writer"""
+    queue_log_row(Message, row)
+
+def _drain_log_queue(block: bool = True) -> list:
+    """Collect up to one batch of queued rows, waiting at most the flush interval"""
+    batch = []
+    if block:
+        batch.append(_log_queue.get())
+    deadline = time.monotonic() + _LOG_FLUSH_INTERVAL
+    while len(batch) < _LOG_BATCH_SIZE:
+        remaining = deadline - time.monotonic()
+        try:
+            if block and remaining > 0:
+                batch.append(_log_queue.get(timeout=remaining))
+            else:
+                batch.append(_log_queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+def _insert_log_rows(model, rows: list) -> None:
+    """Insert rows for one model in the current transaction"""
+    if model is Message:
+        # Redelivered webhooks can repeat a message_id; skip those rather than failing the batch
+        stmt = (
+            insert_on_conflict(Message.__table__)
+            .on_conflict_do_nothing(index_elements=['message_id'])
+            .returning(Message.__table__.c.created_at)
+        )
+        # Only rows actually inserted come back, so skipped redeliveries aren't counted
+        inserted = db.session.execute(stmt, rows).scalars().all()
+        for day, count in Counter(created_at.date() for created_at in inserted).items():
+            Analytics.increment_daily_messages(day, count)
+    else:
+        db.session.execute(model.__table__.insert(), rows)
+
+def _write_log_batch(batch: list) -> None:
+    """Insert a batch of queued rows, one executemany per table"""
+    rows_by_model = {}
+    for model, row in batch:
+        rows_by_model.setdefault(model, []).append(row)
+    
+    with app.app_context():
+        try:
+            for model, rows in rows_by_model.items():
+                _insert_log_rows(model, rows)
+            db.session.commit()
+            return
+        except Exception as e:
+            logger.warning(f"Error writing {len(batch)} queued log rows, retrying row by row: {e}")
+            db.session.rollback()
+        
+        # One bad row shouldn't drop the rest of the batch
+        for model, row in batch:
+            try:
+                _insert_log_rows(model, [row])
+                db.session.commit()
+            except Exception as e:
+                logger.error(f"Error writing queued {model.__name__} row: {e}")
+                db.session.rollback()
+
+def _log_writer() -> None:
+    """Background loop flushing queued rows to the database"""
+    while True:
+        _write_log_batch(_drain_log_queue())
+
+@atexit.register
+def flush_log_queue() -> None:
+    """Write out any rows still queued"""
+    while not _log_queue.empty():
+        batch = _drain_log_queue(block=False)
+        if batch:
+            _write_log_batch(batch)
+
 def get_dashboard_stats() -> dict:
-    """Get comprehensive dashboard statistics"""
-    try:
-        stats = {
-            'total_users': Analytics.get_total_users(),
-            'total_messages': Analytics.get_total_messages(),
-            'uptime': Analytics.get_bot_uptime(),
-            'active_groups': Analytics.get_active_groups(),
-            'commands_used': Analytics.get_commands_used(),
-            'ai_requests': Analytics.get_ai_requests(),
-            'files_processed': Analytics.get_files_processed(),
-            'active_users_7d': Analytics.get_active_users(7),
-            'popular_commands': Analytics.get_popular_commands(5),
-            'daily_messages': Analytics.get_daily_messages(7),
-            'user_stats': Analytics.get_user_stats(),
-            'message_types': Analytics.get_message_type_stats(),
-            'last_updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
+    """Get comprehensive dashboard statistics (cached for DASHBOARD_TTL seconds)"""
+    if _dashboard_cache["value"] is not None and time.monotonic() - _dashboard_cache["ts"] < _DASHBOARD_TTL:
+        return _dashboard_cache["value"]
+    
+    with _dashboard_lock:
+        # Another thread may have refreshed the cache while we waited
+        if _dashboard_cache["value"] is not None and time.monotonic() - _dashboard_cache["ts"] < _DASHBOARD_TTL:
+            return _dashboard_cache["value"]
         
+        try:
+            stats = _compute_dashboard_stats()
+        except Exception as e:
+            # Serve zeros for this request only; don't cache them over a transient failure
+            logger.error(f"Error getting dashboard stats: {e}")
+            db.session.rollback()
+            return _empty_dashboard_stats()
+        _dashboard_cache["value"] = stats
+        _dashboard_cache["ts"] = time.monotonic()
         return stats
-    except Exception as e:
-        logger.error(f"Error getting dashboard stats: {e}")
-        return {
-            'total_users': 0,
-            'total_messages': 0,
-            'uptime': '0:00:00',
-            'active_groups': 0,
-            'commands_used': 0,
-            'ai_requests': 0,
-            'files_processed': 0,
-            'active_users_7d': 0,
-            'popular_commands': [],
-            'daily_messages': [],
-            'user_stats': {'total': 0, 'active_7d': 0, 'admins': 0, 'banned': 0},
-            'message_types': {},
-            'last_updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
+
+def invalidate_dashboard_stats() -> None:
+    """Force the next get_dashboard_stats call to recompute"""
+    _dashboard_cache["ts"] = 0.0
+
+def _compute_dashboard_stats() -> dict:
+    """Compute dashboard statistics from the database (raises on database errors)"""
+    counters = Analytics.get_scalar_counters(7)
+    return {
+        'total_users': counters['total_users'],
+        'total_messages': counters['total_messages'],
+        'uptime': Analytics.get_bot_uptime(),
+        'active_groups': counters['active_groups'],
+        'commands_used': counters['commands_used'],
+        'ai_requests': counters['ai_requests'],
+        'files_processed': counters['files_processed'],
+        'active_users_7d': counters['active_users'],
+        'popular_commands': Analytics.get_popular_commands(5),
+        'daily_messages': Analytics.get_daily_messages(7),
+        'user_stats': {
+            'total': counters['total_users'],
+            'active_7d': counters['active_users'],
+            'admins': counters['admins'],
+            'banned': counters['banned']
+        },
+        'message_types': Analytics.get_message_type_stats(),
+        'last_updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+def _empty_dashboard_stats() -> dict:
+    """All-zero dashboard statistics shown while the database is unavailable"""
+    return {
+        'total_users': 0,
+        'total_messages': 0,
+        'uptime': '0:00:00',
+        'active_groups': 0,
+        'commands_used': 0,
+        'ai_requests': 0,
+        'files_processed': 0,
+        'active_users_7d': 0,
+        'popular_commands': [],
+        'daily_messages': [],
+        'user_stats': {'total': 0, 'active_7d': 0, 'admins': 0, 'banned': 0},
+        'message_types': {},
+        'last_updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
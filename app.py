@@ -1,5 +1,7 @@
 import os
 import logging
+import time
+import orjson
 from flask import Flask, render_template, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
@@ -7,7 +9,7 @@ from werkzeug.middleware.proxy_fix import ProxyFix
 from datetime import datetime
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=logging.DEBUG if os.environ.get("LOG_LEVEL") == "DEBUG" else logging.INFO)
 logger = logging.getLogger(__name__)
 
 class Base(DeclarativeBase):
@@ -25,26 +27,40 @@ database_url = os.environ.get("DATABASE_URL")
 if not database_url or database_url == "":
     database_url = "sqlite:///whatsapp_bot.db"
 app.config["SQLALCHEMY_DATABASE_URI"] = database_url
+# Each gunicorn worker serves GUNICORN_THREADS requests at once, plus the background
+# log writer and ban refresher; SQLAlchemy's default overflow covers bursts
+_worker_threads = int(os.environ.get("GUNICORN_THREADS", "4"))
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+    "pool_size": int(os.environ.get("DB_POOL_SIZE", str(_worker_threads + 2))),
     "pool_recycle": 300,
     "pool_pre_ping": True,
+    "pool_use_lifo": True,
+    "query_cache_size": 1200,
 }
+if database_url.startswith(("postgres://", "postgresql")):
+    # JIT planning costs more than it saves on the dashboard's small counts
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"]["connect_args"] = {"options": "-c jit=off"}
 
 # Initialize the app with the extension
 db.init_app(app)
 
 # Store bot start time for uptime calculation
 app.config['BOT_START_TIME'] = datetime.now()
+app.config['BOT_START_MONO'] = time.monotonic()
 
 with app.app_context():
     # Import models and analytics
     import models
-    import analytics
+    from analytics import Analytics, get_dashboard_stats, invalidate_dashboard_stats
     
     # Create all database tables
     db.create_all()
+    models.upgrade_schema()
     logger.info("Database tables created successfully")
     
+    # Seed the daily message rollup from existing messages
+    Analytics.backfill_daily_messages()
+    
     # Import bot after database is set up
     try:
         from bot import wa  # Import WhatsApp bot instance
@@ -55,12 +71,15 @@ with app.app_context():
     except Exception as e:
         logger.warning(f"Error importing WhatsApp bot: {e}")
 
+def orjson_response(data, status: int = 200):
+    """Serialize data with orjson into a JSON response"""
+    return app.response_class(orjson.dumps(data, option=orjson.OPT_NAIVE_UTC), status=status, mimetype="application/json")
+
 # Routes
 @app.route('/')
 def dashboard():
     """Admin dashboard route"""
     try:
-        from analytics import get_dashboard_stats
         stats = get_dashboard_stats()
         return render_template('dashboard.html', stats=stats)
     except Exception as e:
@@ -79,17 +98,30 @@ def dashboard():
 def api_stats():
     """API endpoint for real-time stats"""
     try:
-        from analytics import get_dashboard_stats
         stats = get_dashboard_stats()
-        return jsonify(stats)
+        return orjson_response(stats)
     except Exception as e:
         logger.error(f"API stats error: {e}")
         return jsonify({'error': 'Failed to fetch stats'}), 500
 
+@app.route('/api/stats/refresh', methods=['POST'])
+def api_stats_refresh():
+    """Clear the stats cache and return freshly computed stats"""
+    try:
+        invalidate_dashboard_stats()
+        stats = get_dashboard_stats()
+        return orjson_response(stats)
+    except Exception as e:
+        logger.error(f"API stats refresh error: {e}")
+        return jsonify({'error': 'Failed to refresh stats'}), 500
+
 @app.route('/webhook', methods=['GET', 'POST'])
 def webhook():
     """WhatsApp webhook endpoint - handled by PyWa"""
     return '', 200
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    if os.environ.get("FLASK_ENV") == "development":
+        app.run(host="0.0.0.0", port=5000, debug=True)
+    else:
+        os.execvp("gunicorn", ["gunicorn", "-c", "gunicorn.conf.py", "app:app"])
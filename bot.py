@@ -1,11 +1,17 @@
 import os
+import sys
 import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
 from pywa import WhatsApp, types, filters
 from pywa.errors import WhatsAppError
 from app import app, db
 from config import Config
-from models import User, Group, Message
+from models import User, Group, insert_on_conflict
+from analytics import Analytics, queue_message_log
 from datetime import datetime
+from sqlalchemy import func, select
 
 # Import command handlers
 from commands.help import handle_help_command
@@ -36,67 +42,168 @@ if Config.WHATSAPP_PHONE_ID and Config.WHATSAPP_ACCESS_TOKEN:
 else:
     logger.warning("WhatsApp bot running in demo mode - no API credentials provided")
 
-def get_or_create_user(phone_number: str, name: str = None) -> User:
-    """Get or create user in database"""
-    with app.app_context():
-        user = User.query.filter_by(phone_number=phone_number).first()
-        if not user:
-            user = User(
-                phone_number=phone_number,
-                name=name,
-                is_admin=(phone_number == Config.BOT_ADMIN_PHONE)
-            )
-            db.session.add(user)
-            db.session.commit()
-            logger.info(f"Created new user: {phone_number}")
-        else:
-            user.last_seen = datetime.utcnow()
-            if name and not user.name:
-                user.name = name
-            db.session.commit()
-        return user
+# Short-lived per-process cache of user snapshots; bans change rarely
+_USER_CACHE_TTL = 60
+_USER_CACHE_MAXSIZE = 4096
+_user_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_user_cache_lock = threading.Lock()
+
+CachedUser = namedtuple('CachedUser', ['id', 'phone_number', 'name', 'is_admin', 'is_banned'])
 
-def log_message(message: types.Message) -> None:
-    """Log message to database"""
-    with app.app_context():
+def invalidate_user_cache(phone_number: str) -> None:
+    """Drop a cached user snapshot (call after changing ban/admin state)"""
+    with _user_cache_lock:
+        _user_cache.pop(phone_number, None)
+
+# Banned phone numbers, refreshed in the background so banned senders skip the database
+_BANNED_REFRESH_INTERVAL = 30
+_banned_phones: frozenset = frozenset()
+_banned_lock = threading.Lock()
+_banned_refresher = None
+# Bumped by set_user_banned so a refresh that raced a ban/unban is discarded
+_banned_generation = 0
+
+def _refresh_banned_phones():
+    """Periodically reload the banned phone number set"""
+    global _banned_phones
+    while True:
         try:
-            user = get_or_create_user(message.from_user.wa_id, message.from_user.name)
-            
-            # Check if user is banned
-            if user.is_banned:
-                message.reply_text("❌ You are banned from using this bot.")
-                return
-            
-            msg = Message(
-                message_id=message.id,
-                user_id=user.id,
-                content=getattr(message, 'text', ''),
-                message_type=message.type.value,
-                is_command=message.text and message.text.startswith(Config.BOT_PREFIX) if hasattr(message, 'text') else False,
-                command_name=message.text.split()[0][1:] if message.text and message.text.startswith(Config.BOT_PREFIX) else None
-            )
-            
-            # Handle group messages
-            if hasattr(message, 'from_') and hasattr(message.from_, 'group_id'):
-                group = Group.query.filter_by(group_id=message.from_.group_id).first()
-                if not group:
-                    group = Group(group_id=message.from_.group_id)
-                    db.session.add(group)
-                    db.session.commit()
-                msg.group_id = group.id
-            
-            db.session.add(msg)
-            db.session.commit()
+            with _banned_lock:
+                generation = _banned_generation
+            with app.app_context():
+                phones = db.session.execute(
+                    select(User.phone_number).where(User.is_banned.is_(True))
+                ).scalars().all()
+            with _banned_lock:
+                # A ban/unban applied while the query ran may not be in its result
+                if generation == _banned_generation:
+                    _banned_phones = frozenset(phones)
         except Exception as e:
-            logger.error(f"Error logging message: {e}")
+            logger.error(f"Error refreshing banned users: {e}")
+        time.sleep(_BANNED_REFRESH_INTERVAL)
+
+def is_phone_banned(phone_number: str) -> bool:
+    """Check the in-memory banned set (starts the refresher on first use)"""
+    global _banned_refresher
+    if _banned_refresher is None:
+        with _banned_lock:
+            if _banned_refresher is None:
+                _banned_refresher = threading.Thread(target=_refresh_banned_phones, name="banned-refresher", daemon=True)
+                _banned_refresher.start()
+    return phone_number in _banned_phones
+
+def set_user_banned(phone_number: str, banned: bool) -> None:
+    """Apply a committed ban/unban to the banned set and user cache"""
+    global _banned_phones, _banned_generation
+    with _banned_lock:
+        _banned_generation += 1
+        if banned:
+            _banned_phones = _banned_phones | {phone_number}
+        else:
+            _banned_phones = _banned_phones - {phone_number}
+    invalidate_user_cache(phone_number)
+
+def get_or_create_user(phone_number: str, name: str = None, commit: bool = True) -> CachedUser:
+    """Get or create user in database with a single upsert (cached for _USER_CACHE_TTL seconds)"""
+    with _user_cache_lock:
+        entry = _user_cache.get(phone_number)
+        if entry and entry[0] > time.monotonic():
+            _user_cache.move_to_end(phone_number)
+            return entry[1]
+    
+    now = datetime.utcnow()
+    stmt = insert_on_conflict(User).values(
+        phone_number=phone_number,
+        name=name,
+        is_admin=(phone_number == Config.BOT_ADMIN_PHONE),
+        is_banned=False,
+        created_at=now,
+        last_seen=now
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[User.phone_number],
+        set_={
+            'last_seen': stmt.excluded.last_seen,
+            'name': func.coalesce(User.name, stmt.excluded.name),
+            # An inbound message proves the number is reachable again for broadcasts
+            'consecutive_failures': 0
+        }
+    ).returning(User)
+    
+    user = db.session.scalars(stmt, execution_options={'populate_existing': True}).one()
+    snapshot = CachedUser(user.id, user.phone_number, user.name, user.is_admin, user.is_banned)
+    if user.created_at == now:
+        logger.info("Created new user: %s", phone_number)
+    if commit:
+        db.session.commit()
+    
+    with _user_cache_lock:
+        _user_cache[phone_number] = (time.monotonic() + _USER_CACHE_TTL, snapshot)
+        _user_cache.move_to_end(phone_number)
+        while len(_user_cache) > _USER_CACHE_MAXSIZE:
+            _user_cache.popitem(last=False)
+    return snapshot
+
+def get_or_create_group(group_id: str) -> int:
+    """Get or create group in database, returning its primary key"""
+    stmt = insert_on_conflict(Group).values(group_id=group_id)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Group.group_id],
+        set_={'group_id': stmt.excluded.group_id}
+    ).returning(Group.id)
+    return db.session.execute(stmt).scalar_one()
+
+def log_message(message: types.Message, user: CachedUser, is_command: bool = False, command_name: str = None) -> None:
+    """Log message to database (message row is written asynchronously)"""
+    try:
+        row = {
+            'message_id': message.id,
+            'user_id': user.id,
+            'group_id': None,
+            'content': getattr(message, 'text', ''),
+            'message_type': message.type.value,
+            'is_command': is_command,
+            'command_name': command_name,
+            'created_at': datetime.utcnow()
+        }
+        
+        # Handle group messages
+        if hasattr(message, 'from_') and hasattr(message.from_, 'group_id'):
+            row['group_id'] = get_or_create_group(message.from_.group_id)
+            db.session.commit()
+        
+        # The message row itself is written by the background batch writer
+        queue_message_log(row)
+        if command_name in KNOWN_COMMANDS:
+            Analytics.record_command(command_name)
+    except Exception as e:
+        logger.error(f"Error logging message: {e}")
+        db.session.rollback()
+
+# Commands routed by handle_command; only these count towards the popularity stats
+ADMIN_COMMANDS = frozenset({"admin", "broadcast", "ban", "unban", "stats"})
+GROUP_COMMANDS = frozenset({"kick", "ban", "mute", "unmute", "promote", "demote"})
+KNOWN_COMMANDS = frozenset({"help", "start"}) | ADMIN_COMMANDS | GROUP_COMMANDS
+
+# Width of the Message.command_name column
+_MAX_COMMAND_NAME = 50
+
+def parse_command(text: str):
+    """Return (is_command, command_name) for a message text"""
+    prefix = Config.BOT_PREFIX
+    if not text or not text.startswith(prefix):
+        return False, None
+    parts = text[len(prefix):].split(maxsplit=1)
+    return True, sys.intern(parts[0].lower()[:_MAX_COMMAND_NAME]) if parts else ""
 
 def handle_message(client: WhatsApp, msg: types.Message):
     """Main message handler"""
     try:
-        user = get_or_create_user(msg.from_user.wa_id, msg.from_user.name)
-        
-        # Check if user is banned
-        if user.is_banned:
+        # Check if user is banned (in-memory set first, then the user record)
+        user = None
+        if not is_phone_banned(msg.from_user.wa_id):
+            user = get_or_create_user(msg.from_user.wa_id, msg.from_user.name)
+        if user is None or user.is_banned:
             admin_contact = getattr(Config, "BOT_ADMIN_PHONE", None)
             admin_msg = f"❌ You are banned from using this bot."
             if admin_contact:
@@ -104,19 +211,20 @@ def handle_message(client: WhatsApp, msg: types.Message):
             msg.reply_text(admin_msg)
             return
 
-        log_message(msg)
+        is_command, command_name = parse_command(msg.text)
+        log_message(msg, user, is_command, command_name)
         
         # Check if it's a command
-        if msg.text and msg.text.startswith(Config.BOT_PREFIX):
-            handle_command(client, msg)
+        if is_command:
+            handle_command(client, msg, user, command_name)
         else:
             # Handle different message types
             if msg.type == types.MessageType.TEXT:
-                handle_ai_chat(client, msg)
+                handle_ai_chat(client, msg, user)
             elif msg.type == types.MessageType.IMAGE:
-                handle_image_message(client, msg)
+                handle_image_message(client, msg, user)
             elif msg.type == types.MessageType.DOCUMENT:
-                handle_file_message(client, msg)
+                handle_file_message(client, msg, user)
             else:
                 msg.reply_text(
                     f"🤖 I received your message! Send me text to chat or use {Config.BOT_PREFIX}help for commands."
@@ -129,21 +237,16 @@ def handle_message(client: WhatsApp, msg: types.Message):
 if wa:
     wa.on_message()(handle_message)
 
-def handle_command(client: WhatsApp, msg: types.Message):
+def handle_command(client: WhatsApp, msg: types.Message, user: CachedUser, command: str):
     """Handle bot commands"""
-    command_text = msg.text.lower()
-    command = command_text.split()[0][1:]  # Remove prefix
-    
-    user = get_or_create_user(msg.from_user.wa_id, msg.from_user.name)
-    
     try:
         if command == "help":
             handle_help_command(client, msg, user)
         elif command == "start":
             handle_start_command(client, msg, user)
-        elif command in ["admin", "broadcast", "ban", "unban", "stats"]:
+        elif command in ADMIN_COMMANDS:
             handle_admin_commands(client, msg, user, command)
-        elif command in ["kick", "ban", "mute", "unmute", "promote", "demote"]:
+        elif command in GROUP_COMMANDS:
             handle_group_commands(client, msg, user, command)
         else:
             msg.reply_text(
@@ -181,7 +284,7 @@ def handle_button_callback(client: WhatsApp, clb: types.CallbackButton):
 
 def handle_message_status(client: WhatsApp, status: types.MessageStatus):
     """Handle message status updates"""
-    logger.debug(f"Message {status.id} status: {status.status}")
+    logger.debug("Message %s status: %s", status.id, status.status)
 
 # Register all handlers if WhatsApp bot is initialized
 if wa:
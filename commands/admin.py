@@ -5,17 +5,40 @@ from config import Config
 from app import db
 from analytics import Analytics
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import select, update
 
 logger = logging.getLogger(__name__)
 
+BOT_PREFIX = Config.BOT_PREFIX
+BOT_NAME = Config.BOT_NAME
+
+# Broadcast fan-out limits
+BROADCAST_CONCURRENCY = 50
+BROADCAST_PAGE_SIZE = 500
+BROADCAST_MAX_FAILURES = 5
+
+# Static parts of the admin panel, rendered once from config
+_ADMIN_PANEL_HEADER = f"👑 *{BOT_NAME} - Admin Panel*\n\n📊 *Quick Stats:*\n"
+_ADMIN_PANEL_FOOTER = "\n".join([
+    "",
+    "🛠️ *Available Actions:*",
+    f"`{BOT_PREFIX}stats` - Detailed statistics",
+    f"`{BOT_PREFIX}broadcast <msg>` - Send to all users",
+    f"`{BOT_PREFIX}ban <phone>` - Ban user",
+    f"`{BOT_PREFIX}unban <phone>` - Unban user",
+    "",
+    "🔗 *Quick Links:*",
+    "• Visit dashboard for detailed analytics",
+    f"• Webhook URL: {Config.WEBHOOK_URL}/webhook",
+    ""
+])
+
 def handle_admin_commands(client: WhatsApp, message, user: User, command: str):
     """Handle admin commands"""
     try:
         if not user.is_admin:
-            if hasattr(message, 'reply_text'):
-                message.reply_text("❌ Access denied. Admin privileges required.")
-            else:
-                message.reply_text("❌ Access denied. Admin privileges required.")
+            message.reply_text("❌ Access denied. Admin privileges required.")
             return
         
         if command == "admin":
@@ -29,45 +52,27 @@ def handle_admin_commands(client: WhatsApp, message, user: User, command: str):
         elif command == "stats":
             show_bot_stats(client, message, user)
         else:
-            if hasattr(message, 'reply_text'):
-                message.reply_text(f"❓ Unknown admin command: {command}")
-            else:
-                message.reply_text(f"❓ Unknown admin command: {command}")
+            message.reply_text(f"❓ Unknown admin command: {command}")
                 
     except Exception as e:
         logger.error(f"Error in admin command {command}: {e}")
-        if hasattr(message, 'reply_text'):
-            message.reply_text("❌ Error executing admin command.")
-        else:
-            message.reply_text("❌ Error executing admin command.")
+        message.reply_text("❌ Error executing admin command.")
 
 def show_admin_panel(client: WhatsApp, message, user: User):
     """Show admin control panel"""
     try:
-        panel_text = f"👑 *{Config.BOT_NAME} - Admin Panel*\n\n"
-        
         # Quick stats
-        total_users = Analytics.get_total_users()
-        total_messages = Analytics.get_total_messages()
-        active_users = Analytics.get_active_users(24)  # Last 24 hours
-        ai_requests = Analytics.get_ai_requests()
-        
-        panel_text += "📊 *Quick Stats:*\n"
-        panel_text += f"• Total Users: {total_users}\n"
-        panel_text += f"• Total Messages: {total_messages}\n"
-        panel_text += f"• Active Users (24h): {active_users}\n"
-        panel_text += f"• AI Requests: {ai_requests}\n"
-        panel_text += f"• Bot Uptime: {Analytics.get_bot_uptime()}\n\n"
-        
-        panel_text += "🛠️ *Available Actions:*\n"
-        panel_text += f"`{Config.BOT_PREFIX}stats` - Detailed statistics\n"
-        panel_text += f"`{Config.BOT_PREFIX}broadcast <msg>` - Send to all users\n"
-        panel_text += f"`{Config.BOT_PREFIX}ban <phone>` - Ban user\n"
-        panel_text += f"`{Config.BOT_PREFIX}unban <phone>` - Unban user\n\n"
-        
-        panel_text += "🔗 *Quick Links:*\n"
-        panel_text += "• Visit dashboard for detailed analytics\n"
-        panel_text += f"• Webhook URL: {Config.WEBHOOK_URL}/webhook\n"
+        snapshot = Analytics.get_dashboard_snapshot()
+        
+        panel_text = (
+            f"{_ADMIN_PANEL_HEADER}"
+            f"• Total Users: {snapshot['total_users']}\n"
+            f"• Total Messages: {snapshot['total_messages']}\n"
+            f"• Active Users (24h): {snapshot['active_users_24h']}\n"
+            f"• AI Requests: {snapshot['ai_requests']}\n"
+            f"• Bot Uptime: {Analytics.get_bot_uptime()}\n"
+            f"{_ADMIN_PANEL_FOOTER}"
+        )
         
         buttons = [
             types.Button(title="📊 Full Stats", callback_data="admin_stats"),
@@ -75,19 +80,13 @@ def show_admin_panel(client: WhatsApp, message, user: User):
             types.Button(title="🔧 Settings", callback_data="admin_settings")
         ]
         
-        if hasattr(message, 'reply_text'):
-            message.reply_text(text=panel_text, buttons=buttons)
-        else:
-            message.reply_text(text=panel_text, buttons=buttons)
+        message.reply_text(text=panel_text, buttons=buttons)
             
         logger.info(f"Admin panel shown to user {user.phone_number}")
         
     except Exception as e:
         logger.error(f"Error showing admin panel: {e}")
-        if hasattr(message, 'reply_text'):
-            message.reply_text("❌ Error loading admin panel.")
-        else:
-            message.reply_text("❌ Error loading admin panel.")
+        message.reply_text("❌ Error loading admin panel.")
 
 def handle_broadcast(client: WhatsApp, message, user: User):
     """Handle broadcast message to all users"""
@@ -96,7 +95,7 @@ def handle_broadcast(client: WhatsApp, message, user: User):
         if hasattr(message, 'text'):
             text_parts = message.text.split(' ', 1)
             if len(text_parts) < 2:
-                message.reply_text(f"❌ Usage: `{Config.BOT_PREFIX}broadcast <message>`")
+                message.reply_text(f"❌ Usage: `{BOT_PREFIX}broadcast <message>`")
                 return
             
             broadcast_message = text_parts[1]
@@ -104,33 +103,58 @@ def handle_broadcast(client: WhatsApp, message, user: User):
             message.reply_text("❌ No message content provided for broadcast.")
             return
         
-        # Get all active users
-        users = User.query.filter(User.is_banned == False).all()
+        broadcast_text = f"📢 *Broadcast Message*\n\n{broadcast_message}\n\n"
+        broadcast_text += f"_Sent by admin at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}_"
         
-        if not users:
-            message.reply_text("❌ No active users found.")
-            return
+        # Stream reachable recipients (excluding the sender) from a server-side cursor
+        recipients = db.session.execute(
+            select(User.phone_number, User.consecutive_failures)
+            .where(
+                User.is_banned == False,
+                User.consecutive_failures < BROADCAST_MAX_FAILURES,
+                User.phone_number != user.phone_number
+            )
+            .execution_options(yield_per=BROADCAST_PAGE_SIZE)
+        )
         
         # Send broadcast
         sent_count = 0
         failed_count = 0
         
-        broadcast_text = f"📢 *Broadcast Message*\n\n{broadcast_message}\n\n"
-        broadcast_text += f"_Sent by admin at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}_"
-        
-        for target_user in users:
-            if target_user.phone_number == user.phone_number:
-                continue  # Skip sender
+        # Fan sends out over a bounded pool, one page of recipients at a time
+        with ThreadPoolExecutor(max_workers=BROADCAST_CONCURRENCY) as executor:
+            for page in recipients.partitions():
+                failed_phones = []
+                recovered_phones = []
+                results = executor.map(lambda row: send_broadcast_message(client, row.phone_number, broadcast_text), page)
+                for row, delivered in zip(page, results):
+                    if delivered:
+                        sent_count += 1
+                        if row.consecutive_failures:
+                            recovered_phones.append(row.phone_number)
+                    else:
+                        failed_count += 1
+                        failed_phones.append(row.phone_number)
                 
-            try:
-                client.send_message(
-                    to=target_user.phone_number,
-                    text=broadcast_text
-                )
-                sent_count += 1
-            except Exception as e:
-                logger.error(f"Failed to send broadcast to {target_user.phone_number}: {e}")
-                failed_count += 1
+                # Track consecutive delivery failures so dead numbers drop out of future broadcasts;
+                # one UPDATE per page keeps the IN (...) list within bind-parameter limits
+                if failed_phones:
+                    db.session.execute(
+                        update(User)
+                        .where(User.phone_number.in_(failed_phones))
+                        .values(consecutive_failures=User.consecutive_failures + 1)
+                    )
+                if recovered_phones:
+                    db.session.execute(
+                        update(User)
+                        .where(User.phone_number.in_(recovered_phones))
+                        .values(consecutive_failures=0)
+                    )
+        db.session.commit()
+        
+        if sent_count == 0 and failed_count == 0:
+            message.reply_text("❌ No active users found.")
+            return
         
         result_text = f"📢 *Broadcast Complete*\n\n"
         result_text += f"✅ Sent to: {sent_count} users\n"
@@ -145,13 +169,22 @@ def handle_broadcast(client: WhatsApp, message, user: User):
         logger.error(f"Error in broadcast: {e}")
         message.reply_text("❌ Error sending broadcast message.")
 
+def send_broadcast_message(client: WhatsApp, phone_number: str, text: str) -> bool:
+    """Send one broadcast message, returning whether it was delivered"""
+    try:
+        client.send_message(to=phone_number, text=text)
+        return True
+    except Exception as e:
+        logger.error(f"Failed to send broadcast to {phone_number}: {e}")
+        return False
+
 def handle_ban_user(client: WhatsApp, message, user: User):
     """Handle banning a user"""
     try:
         if hasattr(message, 'text'):
             text_parts = message.text.split(' ', 1)
             if len(text_parts) < 2:
-                message.reply_text(f"❌ Usage: `{Config.BOT_PREFIX}ban <phone_number>`")
+                message.reply_text(f"❌ Usage: `{BOT_PREFIX}ban <phone_number>`")
                 return
             
             target_phone = text_parts[1].strip()
@@ -159,8 +192,8 @@ def handle_ban_user(client: WhatsApp, message, user: User):
             message.reply_text("❌ No phone number provided.")
             return
         
-        # Find target user
-        target_user = User.query.filter_by(phone_number=target_phone).first()
+        # Find and lock target user; the checks and update share one transaction
+        target_user = User.query.filter_by(phone_number=target_phone).with_for_update().first()
         if not target_user:
             message.reply_text(f"❌ User {target_phone} not found.")
             return
@@ -177,6 +210,9 @@ def handle_ban_user(client: WhatsApp, message, user: User):
         target_user.is_banned = True
         db.session.commit()
         
+        from bot import set_user_banned
+        set_user_banned(target_phone, True)
+        
         # Notify the banned user
         try:
             client.send_message(
@@ -199,7 +235,7 @@ def handle_unban_user(client: WhatsApp, message, user: User):
         if hasattr(message, 'text'):
             text_parts = message.text.split(' ', 1)
             if len(text_parts) < 2:
-                message.reply_text(f"❌ Usage: `{Config.BOT_PREFIX}unban <phone_number>`")
+                message.reply_text(f"❌ Usage: `{BOT_PREFIX}unban <phone_number>`")
                 return
             
             target_phone = text_parts[1].strip()
@@ -207,8 +243,8 @@ def handle_unban_user(client: WhatsApp, message, user: User):
             message.reply_text("❌ No phone number provided.")
             return
         
-        # Find target user
-        target_user = User.query.filter_by(phone_number=target_phone).first()
+        # Find and lock target user; the checks and update share one transaction
+        target_user = User.query.filter_by(phone_number=target_phone).with_for_update().first()
         if not target_user:
             message.reply_text(f"❌ User {target_phone} not found.")
             return
@@ -221,6 +257,9 @@ def handle_unban_user(client: WhatsApp, message, user: User):
         target_user.is_banned = False
         db.session.commit()
         
+        from bot import set_user_banned
+        set_user_banned(target_phone, False)
+        
         # Notify the unbanned user
         try:
             client.send_message(
@@ -240,58 +279,53 @@ def handle_unban_user(client: WhatsApp, message, user: User):
 def show_bot_stats(client: WhatsApp, message, user: User):
     """Show detailed bot statistics"""
     try:
-        stats_text = f"📊 *{Config.BOT_NAME} - Statistics*\n\n"
-        
-        # User statistics
-        user_stats = Analytics.get_user_stats()
-        stats_text += "👥 *User Statistics:*\n"
-        stats_text += f"• Total Users: {user_stats['total']}\n"
-        stats_text += f"• Active (7 days): {user_stats['active_7d']}\n"
-        stats_text += f"• Admins: {user_stats['admins']}\n"
-        stats_text += f"• Banned: {user_stats['banned']}\n\n"
-        
-        # Message statistics
-        total_messages = Analytics.get_total_messages()
-        commands_used = Analytics.get_commands_used()
-        ai_requests = Analytics.get_ai_requests()
-        files_processed = Analytics.get_files_processed()
-        
-        stats_text += "💬 *Message Statistics:*\n"
-        stats_text += f"• Total Messages: {total_messages}\n"
-        stats_text += f"• Commands Used: {commands_used}\n"
-        stats_text += f"• AI Requests: {ai_requests}\n"
-        stats_text += f"• Files Processed: {files_processed}\n\n"
+        snapshot = Analytics.get_dashboard_snapshot()
+        
+        # User and message statistics
+        lines = [
+            f"📊 *{BOT_NAME} - Statistics*",
+            "",
+            "👥 *User Statistics:*",
+            f"• Total Users: {snapshot['total_users']}",
+            f"• Active (7 days): {snapshot['active_users']}",
+            f"• Admins: {snapshot['admins']}",
+            f"• Banned: {snapshot['banned']}",
+            "",
+            "💬 *Message Statistics:*",
+            f"• Total Messages: {snapshot['total_messages']}",
+            f"• Commands Used: {snapshot['commands_used']}",
+            f"• AI Requests: {snapshot['ai_requests']}",
+            f"• Files Processed: {snapshot['files_processed']}",
+            ""
+        ]
         
         # Popular commands
-        popular_commands = Analytics.get_popular_commands(5)
+        popular_commands = snapshot['popular_commands']
         if popular_commands:
-            stats_text += "🔥 *Popular Commands:*\n"
-            for cmd in popular_commands:
-                stats_text += f"• /{cmd['command']}: {cmd['count']} uses\n"
-            stats_text += "\n"
+            lines.append("🔥 *Popular Commands:*")
+            lines.extend(f"• /{cmd['command']}: {cmd['count']} uses" for cmd in popular_commands)
+            lines.append("")
         
         # System info
-        stats_text += "⚙️ *System Information:*\n"
-        stats_text += f"• Bot Uptime: {Analytics.get_bot_uptime()}\n"
-        stats_text += f"• Active Groups: {Analytics.get_active_groups()}\n"
-        stats_text += f"• Bot Prefix: {Config.BOT_PREFIX}\n"
-        stats_text += f"• Last Updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+        lines.extend([
+            "⚙️ *System Information:*",
+            f"• Bot Uptime: {Analytics.get_bot_uptime()}",
+            f"• Active Groups: {snapshot['active_groups']}",
+            f"• Bot Prefix: {BOT_PREFIX}",
+            f"• Last Updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+            ""
+        ])
+        stats_text = "\n".join(lines)
         
         buttons = [
             types.Button(title="🔄 Refresh", callback_data="admin_stats"),
             types.Button(title="📈 Dashboard", callback_data="admin_dashboard")
         ]
         
-        if hasattr(message, 'reply_text'):
-            message.reply_text(text=stats_text, buttons=buttons)
-        else:
-            message.reply_text(text=stats_text, buttons=buttons)
+        message.reply_text(text=stats_text, buttons=buttons)
             
         logger.info(f"Bot stats shown to admin {user.phone_number}")
         
     except Exception as e:
         logger.error(f"Error showing bot stats: {e}")
-        if hasattr(message, 'reply_text'):
-            message.reply_text("❌ Error loading statistics.")
-        else:
-            message.reply_text("❌ Error loading statistics.")
+        message.reply_text("❌ Error loading statistics.")
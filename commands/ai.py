@@ -1,20 +1,40 @@
 import logging
-import os
-import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from itertools import islice
 from pywa import WhatsApp, types
 from models import User, AIRequest, FileProcessing
 from config import Config
-from app import db
+from analytics import queue_log_row
+from datetime import datetime
 from gemini_service import AIService
 from file_processor import FileProcessor
+from utils.helpers import truncate_utf8
 
 logger = logging.getLogger(__name__)
 
-def handle_ai_chat(client: WhatsApp, message: types.Message):
+# Worker pool for WhatsApp calls that can overlap with the main handler work (acks, reactions)
+_background = ThreadPoolExecutor(max_workers=8, thread_name_prefix="ai-background")
+
+# Gemini chat calls run here so the handler can wait briefly before sending a placeholder
+_chat_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="ai-chat")
+THINKING_DELAY = 0.5
+
+# Supported formats listed in the unsupported-file reply
+_SUPPORTED_FORMATS_TEXT = (
+    f"❌ Unsupported file type. Supported formats:\n"
+    f"📄 Documents: {', '.join(sorted(Config.SUPPORTED_FILE_TYPES)[:10])}\n"
+    f"🖼️ Images: {', '.join(sorted(Config.SUPPORTED_IMAGE_TYPES))}"
+)
+
+# Byte budgets for logged AI prompts/responses
+_LOG_PROMPT_BYTES = 1000
+_LOG_RESPONSE_BYTES = 2000
+
+def handle_ai_chat(client: WhatsApp, message: types.Message, user: User = None):
     """Handle AI chat messages"""
     try:
-        user = get_user_from_message(message)
+        user = user or get_user_from_message(message)
         if not user or user.is_banned:
             return
         
@@ -22,9 +42,6 @@ def handle_ai_chat(client: WhatsApp, message: types.Message):
             message.reply_text("🤖 Send me a text message to start chatting!")
             return
         
-        # Show typing indicator
-        message.reply_text("🤔 Thinking...")
-        
         start_time = time.time()
         
         # Get AI response
@@ -34,7 +51,13 @@ def handle_ai_chat(client: WhatsApp, message: types.Message):
             'is_admin': user.is_admin
         }
         
-        ai_response = AIService.chat_response(message.text, user_context)
+        future = _chat_pool.submit(AIService.chat_response, message.text, user_context)
+        try:
+            ai_response = future.result(timeout=THINKING_DELAY)
+        except FutureTimeoutError:
+            # Only show the typing indicator when the response is slow
+            message.reply_text("🤔 Thinking...")
+            ai_response = future.result()
         processing_time = time.time() - start_time
         
         # Log AI request
@@ -42,7 +65,7 @@ def handle_ai_chat(client: WhatsApp, message: types.Message):
         
         # Send response with reaction
         message.reply_text(ai_response)
-        message.react("🤖")
+        _background.submit(message.react, "🤖")
         
         logger.info(f"AI chat processed for {user.phone_number} in {processing_time:.2f}s")
         
@@ -50,19 +73,21 @@ def handle_ai_chat(client: WhatsApp, message: types.Message):
         logger.error(f"Error in AI chat: {e}")
         message.reply_text("❌ Sorry, I'm having trouble thinking right now. Please try again! 🤖")
 
-def handle_image_message(client: WhatsApp, message: types.Message):
+def handle_image_message(client: WhatsApp, message: types.Message, user: User = None):
     """Handle image analysis"""
     try:
-        user = get_user_from_message(message)
+        user = user or get_user_from_message(message)
         if not user or user.is_banned:
             return
         
-        message.reply_text("📸 Analyzing your image...")
-        
         try:
-            # Download image
-            media_url = client.get_media_url(message.image.id)
-            image_bytes = FileProcessor.download_whatsapp_media(media_url, Config.WHATSAPP_ACCESS_TOKEN)
+            # Download image while the acknowledgement is being sent
+            ack = _background.submit(message.reply_text, "📸 Analyzing your image...")
+            try:
+                media_url = client.get_media_url(message.image.id)
+                image_bytes = FileProcessor.download_whatsapp_media(media_url, Config.WHATSAPP_ACCESS_TOKEN)
+            finally:
+                wait([ack])
             
             if not image_bytes:
                 message.reply_text("❌ Failed to download image. Please try again.")
@@ -80,7 +105,7 @@ def handle_image_message(client: WhatsApp, message: types.Message):
             # Send analysis
             response_text = f"🖼️ *Image Analysis*\n\n{analysis}"
             message.reply_text(response_text)
-            message.react("👁️")
+            _background.submit(message.react, "👁️")
             
             logger.info(f"Image analysis completed for {user.phone_number} in {processing_time:.2f}s")
             
@@ -92,10 +117,10 @@ def handle_image_message(client: WhatsApp, message: types.Message):
         logger.error(f"Error in image handler: {e}")
         message.reply_text("❌ Error processing image.")
 
-def handle_file_message(client: WhatsApp, message: types.Message):
+def handle_file_message(client: WhatsApp, message: types.Message, user: User = None):
     """Handle file analysis"""
     try:
-        user = get_user_from_message(message)
+        user = user or get_user_from_message(message)
         if not user or user.is_banned:
             return
         
@@ -104,75 +129,54 @@ def handle_file_message(client: WhatsApp, message: types.Message):
         
         # Check if file type is supported
         if not FileProcessor.is_supported_file(filename):
-            message.reply_text(
-                f"❌ Unsupported file type. Supported formats:\n"
-                f"📄 Documents: {', '.join(Config.SUPPORTED_FILE_TYPES[:10])}\n"
-                f"🖼️ Images: {', '.join(Config.SUPPORTED_IMAGE_TYPES)}"
-            )
+            message.reply_text(_SUPPORTED_FORMATS_TEXT)
             return
         
-        message.reply_text(f"📄 Processing file: `{filename}`...")
-        
         try:
-            # Download file
-            media_url = client.get_media_url(document.id)
-            file_bytes = FileProcessor.download_whatsapp_media(media_url, Config.WHATSAPP_ACCESS_TOKEN)
+            # Download file while the acknowledgement is being sent
+            ack = _background.submit(message.reply_text, f"📄 Processing file: `{filename}`...")
+            try:
+                media_url = client.get_media_url(document.id)
+                file_bytes = FileProcessor.download_whatsapp_media(media_url, Config.WHATSAPP_ACCESS_TOKEN)
+            finally:
+                wait([ack])
             
             if not file_bytes:
                 message.reply_text("❌ Failed to download file. Please try again.")
                 return
             
-            # Save to temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(filename)[1]) as temp_file:
-                temp_file.write(file_bytes)
-                temp_file_path = temp_file.name
+            start_time = time.time()
+            
+            # Process file content
+            content, file_info = FileProcessor.process_bytes(file_bytes, filename)
+            
+            if content.startswith("❌"):
+                message.reply_text(content)
+                return
+            
+            # Analyze with AI
+            ai_analysis = AIService.analyze_file_content(content, filename, file_info.get('extension', ''))
+            processing_time = time.time() - start_time
+            
+            # Log processing
+            log_file_processing(user, filename, file_info, processing_time, True, True)
+            log_ai_request(user, 'file_analysis', f"File: {filename}", ai_analysis, processing_time)
+            
+            # Send analysis
+            response_text = f"📄 *File Analysis: {filename}*\n\n{ai_analysis}"
+            
+            # Split long messages
+            if len(response_text) > 4000:
+                # Send the analysis in parts as they are sliced
+                for i, chunk in enumerate(islice(iter_chunks(response_text, 3500), 3)):  # Limit to 3 chunks
+                    message.reply_text(f"📄 *Part {i+1}*\n\n{chunk}")
+            else:
+                message.reply_text(response_text)
+            
+            _background.submit(message.react, "📄")
+            
+            logger.info(f"File analysis completed for {user.phone_number}: {filename} in {processing_time:.2f}s")
             
-            try:
-                start_time = time.time()
-                
-                # Process file content
-                content, file_info = FileProcessor.process_file(temp_file_path)
-                
-                if content.startswith("❌"):
-                    message.reply_text(content)
-                    return
-                
-                # Analyze with AI
-                ai_analysis = AIService.analyze_file_content(content, filename, file_info.get('extension', ''))
-                processing_time = time.time() - start_time
-                
-                # Log processing
-                log_file_processing(user, filename, file_info, processing_time, True, True)
-                log_ai_request(user, 'file_analysis', f"File: {filename}", ai_analysis, processing_time)
-                
-                # Send analysis
-                response_text = f"📄 *File Analysis: {filename}*\n\n{ai_analysis}"
-                
-                # Split long messages
-                if len(response_text) > 4000:
-                    # Send summary first
-                    summary_lines = response_text.split('\n')[:15]
-                    summary = '\n'.join(summary_lines) + "\n\n📄 *[Content truncated for WhatsApp]*"
-                    message.reply_text(summary)
-                    
-                    # Send full analysis in parts
-                    chunks = [response_text[i:i+3500] for i in range(0, len(response_text), 3500)]
-                    for i, chunk in enumerate(chunks[:3]):  # Limit to 3 chunks
-                        if i == 0:
-                            continue  # Skip first chunk as it's already sent as summary
-                        message.reply_text(f"📄 *Part {i+1}*\n\n{chunk}")
-                else:
-                    message.reply_text(response_text)
-                
-                message.react("📄")
-                
-                logger.info(f"File analysis completed for {user.phone_number}: {filename} in {processing_time:.2f}s")
-                
-            finally:
-                # Clean up temp file
-                if os.path.exists(temp_file_path):
-                    os.unlink(temp_file_path)
-                
         except Exception as e:
             logger.error(f"Error processing file {filename}: {e}")
             message.reply_text("❌ Error processing file. Please check the file format and try again.")
@@ -181,39 +185,45 @@ def handle_file_message(client: WhatsApp, message: types.Message):
         logger.error(f"Error in file handler: {e}")
         message.reply_text("❌ Error handling file.")
 
+def iter_chunks(text: str, size: int):
+    """Yield consecutive slices of text, each at most size characters"""
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
 def get_user_from_message(message: types.Message) -> User:
     """Get user from message"""
-    from bot import get_or_create_user
+    from bot import get_or_create_user, is_phone_banned
+    if is_phone_banned(message.from_user.wa_id):
+        return None
     return get_or_create_user(message.from_user.wa_id, message.from_user.name)
 
 def log_ai_request(user: User, request_type: str, prompt: str, response: str, processing_time: float):
-    """Log AI request to database"""
+    """Queue AI request log for the background writer"""
     try:
-        ai_request = AIRequest(
-            user_id=user.id,
-            request_type=request_type,
-            prompt=prompt[:1000],  # Truncate long prompts
-            response=response[:2000],  # Truncate long responses
-            processing_time=processing_time
-        )
-        db.session.add(ai_request)
-        db.session.commit()
+        queue_log_row(AIRequest, {
+            'user_id': user.id,
+            'request_type': request_type,
+            'prompt': truncate_utf8(prompt, _LOG_PROMPT_BYTES),
+            'response': truncate_utf8(response, _LOG_RESPONSE_BYTES),
+            'tokens_used': 0,
+            'processing_time': processing_time,
+            'created_at': datetime.utcnow()
+        })
     except Exception as e:
         logger.error(f"Error logging AI request: {e}")
 
 def log_file_processing(user: User, filename: str, file_info: dict, processing_time: float, content_extracted: bool, ai_analyzed: bool):
-    """Log file processing to database"""
+    """Queue file processing log for the background writer"""
     try:
-        file_processing = FileProcessing(
-            user_id=user.id,
-            filename=filename,
-            file_type=file_info.get('extension', 'unknown'),
-            file_size=file_info.get('size', 0),
-            content_extracted=content_extracted,
-            ai_analyzed=ai_analyzed,
-            processing_time=processing_time
-        )
-        db.session.add(file_processing)
-        db.session.commit()
+        queue_log_row(FileProcessing, {
+            'user_id': user.id,
+            'filename': filename,
+            'file_type': file_info.get('extension', 'unknown'),
+            'file_size': file_info.get('size', 0),
+            'content_extracted': content_extracted,
+            'ai_analyzed': ai_analyzed,
+            'processing_time': processing_time,
+            'created_at': datetime.utcnow()
+        })
     except Exception as e:
         logger.error(f"Error logging file processing: {e}")
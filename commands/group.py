@@ -6,52 +6,66 @@ import re
 
 logger = logging.getLogger(__name__)
 
+BOT_PREFIX = Config.BOT_PREFIX
+
+# Mentions appear right after the command, so only the start of the text is scanned
+_MENTION_SCAN_LIMIT = 512
+_MENTION_OR_PHONE_RE = re.compile(r'@(?P<user>\w+)|(?P<phone>\+?\d[\d\s\-\(\)]{2,})')
+
 def handle_group_commands(client: WhatsApp, message, user: User, command: str):
     """Handle group management commands (ban/unban only)"""
-    try:
-        if not user.is_admin:
-            message.reply_text("❌ Access denied. Admin privileges required.")
-            return
+    if not user.is_admin:
+        message.reply_text("❌ Access denied. Admin privileges required.")
+        return
 
-        # Check if message is from a group
-        if not hasattr(message, "from_") or not hasattr(message.from_, "group_id"):
-            message.reply_text("❌ This command can only be used in groups.")
-            return
+    # Check if message is from a group
+    if not getattr(getattr(message, "from_", None), "group_id", None):
+        message.reply_text("❌ This command can only be used in groups.")
+        return
+
+    handler = _GROUP_DISPATCH.get(command)
+    if not handler:
+        message.reply_text(f"❓ Unknown group command: {command}")
+        return
 
-        if command == "ban":
-            handle_ban_user(client, message, user)
-        elif command == "unban":
-            handle_unban_user(client, message, user)
-        else:
-            message.reply_text(f"❓ Unknown group command: {command}")
-    except Exception as e:
-        logger.error(f"Error in group command {command}: {e}")
+    try:
+        handler(client, message, user)
+    except Exception:
+        logger.exception("Error in group command %s", command)
         message.reply_text("❌ Error executing group command.")
 
 def extract_mentioned_user(message_text: str):
     """Extract mentioned user from message"""
-    mentions = re.findall(r'@(\w+)', message_text)
-    if mentions:
-        return mentions[0]
-    phones = re.findall(r'\+?[\d\s\-\(\)]+', message_text)
-    if phones:
-        return phones[0].strip()
-    return None
+    phone = None
+    for match in _MENTION_OR_PHONE_RE.finditer((message_text or '')[:_MENTION_SCAN_LIMIT]):
+        if match.group('user'):
+            return match.group('user')
+        if phone is None:
+            phone = match.group('phone').strip()
+    return phone
+
+def _find_target_user(message, command: str):
+    """Resolve and lock the mentioned user, replying with usage/not-found errors"""
+    mentioned = extract_mentioned_user(message.text)
+    if not mentioned:
+        message.reply_text(f"❌ Usage: `{BOT_PREFIX}{command} @username` or `{BOT_PREFIX}{command} <phone_number>`")
+        return None, None
+
+    # Find and lock user by phone number or username; the update commits in the same transaction
+    target = User.query.filter(
+        (User.phone_number == mentioned) | (User.name == mentioned)
+    ).with_for_update().first()
+    if not target:
+        message.reply_text(f"❌ User `{mentioned}` not found.")
+    return mentioned, target
 
 def handle_ban_user(client: WhatsApp, message, user: User):
     """Ban a user from the bot (prevents user from interacting with the bot)"""
+    from app import db
+    from bot import set_user_banned
     try:
-        mentioned = extract_mentioned_user(message.text)
-        if not mentioned:
-            message.reply_text(f"❌ Usage: `{Config.BOT_PREFIX}ban @username` or `{Config.BOT_PREFIX}ban <phone_number>`")
-            return
-
-        # Find user in DB by phone number or username
-        banned_user = User.query.filter(
-            (User.phone_number == mentioned) | (User.name == mentioned)
-        ).first()
+        mentioned, banned_user = _find_target_user(message, "ban")
         if not banned_user:
-            message.reply_text(f"❌ User `{mentioned}` not found.")
             return
 
         if banned_user.is_admin:
@@ -62,55 +76,56 @@ def handle_ban_user(client: WhatsApp, message, user: User):
         banned_user.banned_by = user.id
         banned_user.banned_at = types.now()
         banned_user.ban_reason = f"Banned by {user.name or user.phone_number} in group {getattr(message.from_, 'group_id', '')}"
-        from app import db
         db.session.commit()
-
-        response_text = (
-            f"🔨 *Ban User*\n\n"
-            f"User: {banned_user.name or banned_user.phone_number}\n"
-            f"Action: Banned from bot\n"
-            f"By: {user.name or user.phone_number}\n"
-            f"🄾 User will not be able to interact with the bot."
-        )
-        message.reply_text(response_text)
-        logger.info(f"Ban command executed by {user.phone_number} for {mentioned}")
-
-    except Exception as e:
-        logger.error(f"Error banning user: {e}")
+    except Exception:
+        logger.exception("Error banning user")
+        db.session.rollback()
         message.reply_text("❌ Error banning user.")
+        return
+
+    set_user_banned(banned_user.phone_number, True)
+    response_text = (
+        f"🔨 *Ban User*\n\n"
+        f"User: {banned_user.name or banned_user.phone_number}\n"
+        f"Action: Banned from bot\n"
+        f"By: {user.name or user.phone_number}\n"
+        f"🄾 User will not be able to interact with the bot."
+    )
+    message.reply_text(response_text)
+    logger.info("Ban command executed by %s for %s", user.phone_number, mentioned)
 
 def handle_unban_user(client: WhatsApp, message, user: User):
     """Unban a user from the bot (restores user access)"""
+    from app import db
+    from bot import set_user_banned
     try:
-        mentioned = extract_mentioned_user(message.text)
-        if not mentioned:
-            message.reply_text(f"❌ Usage: `{Config.BOT_PREFIX}unban @username` or `{Config.BOT_PREFIX}unban <phone_number>`")
-            return
-
-        unbanned_user = User.query.filter(
-            (User.phone_number == mentioned) | (User.name == mentioned)
-        ).first()
+        mentioned, unbanned_user = _find_target_user(message, "unban")
         if not unbanned_user:
-            message.reply_text(f"❌ User `{mentioned}` not found.")
             return
 
         unbanned_user.is_banned = False
         unbanned_user.banned_by = None
         unbanned_user.banned_at = None
         unbanned_user.ban_reason = None
-        from app import db
         db.session.commit()
-
-        response_text = (
-            f"✅ *Unban User*\n\n"
-            f"User: {unbanned_user.name or unbanned_user.phone_number}\n"
-            f"Action: Unbanned\n"
-            f"By: {user.name or user.phone_number}\n"
-            f"🄾 User can now interact with the bot."
-        )
-        message.reply_text(response_text)
-        logger.info(f"Unban command executed by {user.phone_number} for {mentioned}")
-
-    except Exception as e:
-        logger.error(f"Error unbanning user: {e}")
+    except Exception:
+        logger.exception("Error unbanning user")
+        db.session.rollback()
         message.reply_text("❌ Error unbanning user.")
+        return
+
+    set_user_banned(unbanned_user.phone_number, False)
+    response_text = (
+        f"✅ *Unban User*\n\n"
+        f"User: {unbanned_user.name or unbanned_user.phone_number}\n"
+        f"Action: Unbanned\n"
+        f"By: {user.name or user.phone_number}\n"
+        f"🄾 User can now interact with the bot."
+    )
+    message.reply_text(response_text)
+    logger.info("Unban command executed by %s for %s", user.phone_number, mentioned)
+
+_GROUP_DISPATCH = {
+    "ban": handle_ban_user,
+    "unban": handle_unban_user,
+}
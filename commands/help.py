@@ -1,12 +1,16 @@
 import logging
 import os
-import importlib
+from functools import lru_cache
 from pywa import WhatsApp, types
 from models import User
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+BOT_PREFIX = Config.BOT_PREFIX
+BOT_NAME = Config.BOT_NAME
+
+@lru_cache(maxsize=1)
 def get_command_list():
     # Scan the commands directory for files that start with handle_ and end with _command.py
     commands_dir = os.path.dirname(__file__)
@@ -19,45 +23,49 @@ def get_command_list():
             command_name = fname[:-3]
             commands.append(command_name)
     # Remove duplicates and sort
-    commands = sorted(set(commands))
-    return commands
+    return tuple(sorted(set(commands)))
+
+# Buttons for quick actions
+_HELP_BUTTONS_USER = (
+    types.Button(title="🏠 Start", callback_data="start"),
+    types.Button(title="🄾 Info", callback_data="info")
+)
+_HELP_BUTTONS_ADMIN = _HELP_BUTTONS_USER + (types.Button(title="👑 Admin", callback_data="admin_panel"),)
+
+@lru_cache(maxsize=1)
+def _build_help() -> str:
+    """Render the help text once (it has no admin-only section)"""
+    parts = [
+        f"🤖 *{BOT_NAME} - Help*\n\n",
+        "📚 *Available Commands:*\n\n",
+    ]
+
+    commands = get_command_list()
+    for cmd in commands:
+        emoji = "🄾"
+        parts.append(f"{emoji} *{BOT_PREFIX}{cmd}* – Useful command\n")
+
+    # Add extra instructions or tips
+    parts.extend([
+        "\n💡 *Tips:*\n",
+        "🟢 *Just send me a message to start chatting!*\n",
+        "🟣 *I can analyze images and extract text.*\n",
+        "🟠 *Send me documents for detailed analysis.*\n",
+        "🟤 *Use reactions to interact with my messages.*\n",
+    ])
+
+    return "".join(parts)
 
 def handle_help_command(client: WhatsApp, message, user: User):
     """Handle help command with dynamic command listing and better visuals"""
     try:
-        help_text = f"🤖 *{Config.BOT_NAME} - Help*\n\n"
-        help_text += "📚 *Available Commands:*\n\n"
-
-        commands = get_command_list()
-        for cmd in commands:
-            emoji = "🄾"
-            help_text += f"{emoji} *{Config.BOT_PREFIX}{cmd}* – Useful command\n"
-
-        # Add extra instructions or tips
-        help_text += "\n💡 *Tips:*\n"
-        help_text += "🟢 *Just send me a message to start chatting!*\n"
-        help_text += "🟣 *I can analyze images and extract text.*\n"
-        help_text += "🟠 *Send me documents for detailed analysis.*\n"
-        help_text += "🟤 *Use reactions to interact with my messages.*\n"
-
-        # Buttons for quick actions
-        buttons = [
-            types.Button(title="🏠 Start", callback_data="start"),
-            types.Button(title="🄾 Info", callback_data="info")
-        ]
-        if user.is_admin:
-            buttons.append(types.Button(title="👑 Admin", callback_data="admin_panel"))
-
-        if hasattr(message, 'reply_text'):
-            message.reply_text(text=help_text, buttons=buttons)
-        else:
-            message.reply_text(text=help_text, buttons=buttons)
-
-        logger.info(f"Help command executed for user {user.phone_number}")
-
-    except Exception as e:
-        logger.error(f"Error in help command: {e}")
-        if hasattr(message, 'reply_text'):
-            message.reply_text("❌ Error showing help. Please try again.")
-        else:
-            message.reply_text("❌ Error showing help. Please try again.")
+        help_text = _build_help()
+        buttons = _HELP_BUTTONS_ADMIN if user.is_admin else _HELP_BUTTONS_USER
+
+        message.reply_text(text=help_text, buttons=list(buttons))
+
+        logger.info("Help command executed for user %s", user.phone_number)
+
+    except Exception:
+        logger.exception("Error in help command")
+        message.reply_text("❌ Error showing help. Please try again.")
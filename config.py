@@ -1,8 +1,10 @@
 import os
 from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+# Load environment variables (skipped when a parent process, e.g. the gunicorn re-exec, already did)
+if not os.getenv("_DOTENV_LOADED"):
+    load_dotenv()
+    os.environ["_DOTENV_LOADED"] = "1"
 
 class Config:
     """Configuration class for the WhatsApp bot"""
@@ -31,12 +33,12 @@ class Config:
     
     # Bot Settings
     MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", "16777216"))  # 16MB default
-    SUPPORTED_FILE_TYPES = [
+    SUPPORTED_FILE_TYPES = frozenset({
         'pdf', 'txt', 'html', 'js', 'py', 'json', 'csv', 
         'md', 'xml', 'yaml', 'yml', 'log', 'css', 'java',
         'cpp', 'c', 'php', 'rb', 'go', 'rs', 'swift'
-    ]
-    SUPPORTED_IMAGE_TYPES = ['jpg', 'jpeg', 'png', 'gif', 'webp']
+    })
+    SUPPORTED_IMAGE_TYPES = frozenset({'jpg', 'jpeg', 'png', 'gif', 'webp'})
     
     # AI Configuration
     AI_CHAT_MODEL = "gemini-2.5-flash"
@@ -1,19 +1,58 @@
 import os
 import io
+import re
 import logging
 import mimetypes
-from typing import Optional, Tuple
-import PyPDF2
+from functools import lru_cache
+from itertools import islice
+from typing import Iterator, Optional, Tuple
+try:
+    import pymupdf  # PyMuPDF; the legacy "fitz" name warns on import
+except ImportError:
+    pymupdf = None
 import json
+import orjson
 import csv
-import xml.etree.ElementTree as ET
+try:
+    from lxml import etree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
 import yaml
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import charset_normalizer
 from bs4 import BeautifulSoup
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+# Prefer the C-backed lxml parser for HTML; fall back to the stdlib parser if it isn't installed
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+# C-backed YAML loader/dumper when PyYAML was built with libyaml
+try:
+    from yaml import CSafeLoader as YamlLoader, CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeLoader as YamlLoader, SafeDumper as YamlDumper
+
+# Shared HTTP session so media downloads reuse TLS connections to the Graph API
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(
+    pool_connections=20,
+    pool_maxsize=50,
+    max_retries=Retry(total=2, backoff_factor=0.3)
+))
+
+# Whitespace cleanup for extracted HTML text
+_WS_RE = re.compile(r'[ \t\r\f\v]+')
+_BLANK_LINES_RE = re.compile(r'\s*\n\s*\n\s*')
+_LINE_EDGE_RE = re.compile(r' ?\n ?')
+
 class FileProcessor:
     """File processing utilities for different file types"""
     
@@ -35,36 +74,68 @@ class FileProcessor:
             return {}
     
     @staticmethod
+    @lru_cache(maxsize=1024)
     def is_supported_file(filename: str) -> bool:
         """Check if file type is supported"""
         extension = os.path.splitext(filename)[1].lower()[1:]
         return extension in Config.SUPPORTED_FILE_TYPES
     
     @staticmethod
+    @lru_cache(maxsize=1024)
     def is_supported_image(filename: str) -> bool:
         """Check if image type is supported"""
         extension = os.path.splitext(filename)[1].lower()[1:]
         return extension in Config.SUPPORTED_IMAGE_TYPES
     
+    @staticmethod
+    def _open_binary(source):
+        """Open a file path or raw bytes as a binary stream"""
+        if isinstance(source, (bytes, bytearray)):
+            return io.BytesIO(source)
+        return open(source, 'rb')
+    
+    @staticmethod
+    def _open_text(source, encoding: str = 'utf-8'):
+        """Open a file path or raw bytes as a text stream"""
+        if isinstance(source, (bytes, bytearray)):
+            return io.TextIOWrapper(io.BytesIO(source), encoding=encoding)
+        return open(source, 'r', encoding=encoding)
+    
+    @staticmethod
+    def extract_pdf_pages(source) -> Iterator[str]:
+        """Yield formatted text for each non-empty PDF page"""
+        if pymupdf is not None:
+            if isinstance(source, (bytes, bytearray)):
+                doc = pymupdf.open(stream=source, filetype="pdf")
+            else:
+                doc = pymupdf.open(source)
+            with doc:
+                yield from FileProcessor._format_pdf_pages(page.get_text for page in doc)
+        else:
+            import PyPDF2  # fallback backend, only loaded when PyMuPDF is missing
+            with FileProcessor._open_binary(source) as file:
+                pdf_reader = PyPDF2.PdfReader(file)
+                yield from FileProcessor._format_pdf_pages(page.extract_text for page in pdf_reader.pages)
+    
+    @staticmethod
+    def _format_pdf_pages(page_readers) -> Iterator[str]:
+        """Frame page text as === Page N === blocks, tolerating per-page errors"""
+        for page_num, read_text in enumerate(page_readers):
+            try:
+                text = read_text()
+                if text.strip():
+                    yield f"=== Page {page_num + 1} ===\n{text}\n"
+            except Exception as e:
+                logger.warning(f"Error extracting page {page_num + 1}: {e}")
+                yield f"=== Page {page_num + 1} ===\n[Error extracting content]\n"
+    
     @staticmethod
     def extract_pdf_content(file_path: str) -> str:
         """Extract text content from PDF file"""
         try:
-            content = []
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                
-                for page_num, page in enumerate(pdf_reader.pages):
-                    try:
-                        text = page.extract_text()
-                        if text.strip():
-                            content.append(f"=== Page {page_num + 1} ===\n{text}\n")
-                    except Exception as e:
-                        logger.warning(f"Error extracting page {page_num + 1}: {e}")
-                        content.append(f"=== Page {page_num + 1} ===\n[Error extracting content]\n")
-                
-                return "\n".join(content) if content else "No readable text found in PDF"
-                
+            content = "\n".join(FileProcessor.extract_pdf_pages(file_path))
+            return content or "No readable text found in PDF"
+            
         except Exception as e:
             logger.error(f"Error extracting PDF content: {e}")
             return f"Error reading PDF: {str(e)}"
@@ -73,10 +144,11 @@ class FileProcessor:
     def extract_html_content(file_path: str) -> str:
         """Extract content from HTML file"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
+            # Pass raw bytes so the parser handles encoding detection
+            with FileProcessor._open_binary(file_path) as file:
                 content = file.read()
                 
-            soup = BeautifulSoup(content, 'html.parser')
+            soup = BeautifulSoup(content, HTML_PARSER)
             
             # Remove script and style elements
             for script in soup(["script", "style"]):
@@ -85,10 +157,10 @@ class FileProcessor:
             # Extract text content
             text = soup.get_text()
             
-            # Clean up whitespace
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = '\n'.join(chunk for chunk in chunks if chunk)
+            # Clean up whitespace: collapse runs of spaces, keep at most one blank line between blocks
+            text = _WS_RE.sub(' ', text)
+            text = _BLANK_LINES_RE.sub('\n\n', text)
+            text = _LINE_EDGE_RE.sub('\n', text).strip()
             
             # Also include some structure information
             title = soup.title.string if soup.title else "No title"
@@ -113,11 +185,17 @@ class FileProcessor:
     def extract_json_content(file_path: str) -> str:
         """Extract and format JSON content"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                data = json.load(file)
+            with FileProcessor._open_binary(file_path) as file:
+                raw = file.read()
             
-            # Format JSON nicely
-            formatted_json = json.dumps(data, indent=2, ensure_ascii=False)
+            # Parse with the stdlib: orjson silently turns >64-bit integers into floats
+            data = json.loads(raw)
+            
+            # orjson is much faster for output but refuses >64-bit ints; the stdlib handles those
+            try:
+                formatted_json = orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode('utf-8')
+            except orjson.JSONEncodeError:
+                formatted_json = json.dumps(data, indent=2, ensure_ascii=False)
             
             # Add analysis
             result = f"JSON Document Analysis\n"
@@ -140,34 +218,38 @@ class FileProcessor:
     def extract_csv_content(file_path: str) -> str:
         """Extract and analyze CSV content"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
+            with FileProcessor._open_text(file_path) as file:
                 # Detect delimiter
                 sample = file.read(1024)
                 file.seek(0)
-                sniffer = csv.Sniffer()
-                delimiter = sniffer.sniff(sample).delimiter
+                try:
+                    delimiter = csv.Sniffer().sniff(sample, delimiters=',;\t|').delimiter
+                except csv.Error:
+                    delimiter = ','
                 
                 reader = csv.reader(file, delimiter=delimiter)
-                rows = list(reader)
+                # Keep header + 5 data rows and only count the rest
+                sample_rows = list(islice(reader, 6))
+                remaining = sum(1 for _ in reader)
             
-            if not rows:
+            if not sample_rows:
                 return "Empty CSV file"
             
-            headers = rows[0] if rows else []
-            data_rows = rows[1:] if len(rows) > 1 else []
+            headers = sample_rows[0]
+            data_row_count = len(sample_rows) - 1 + remaining
             
             result = f"CSV Document Analysis\n"
             result += f"Columns: {len(headers)}\n"
-            result += f"Rows: {len(data_rows)}\n"
+            result += f"Rows: {data_row_count}\n"
             result += f"Headers: {', '.join(headers)}\n\n"
             
             # Show first few rows
             result += "Sample Data:\n"
-            for i, row in enumerate(rows[:6]):  # Show header + 5 data rows
+            for i, row in enumerate(sample_rows):  # Show header + 5 data rows
                 result += f"Row {i}: {', '.join(row)}\n"
             
-            if len(rows) > 6:
-                result += f"... and {len(rows) - 6} more rows"
+            if remaining:
+                result += f"... and {remaining} more rows"
             
             return result
             
@@ -179,43 +261,51 @@ class FileProcessor:
     def extract_xml_content(file_path: str) -> str:
         """Extract and analyze XML content"""
         try:
-            tree = ET.parse(file_path)
-            root = tree.getroot()
+            parts = []
+            stack = []  # [element, header_written] per open element
+            root_tag = None
+            root_children = 0
             
-            def xml_to_text(element, level=0):
-                indent = "  " * level
-                text = f"{indent}<{element.tag}"
-                
+            def header(element, level):
+                text = f"{'  ' * level}<{element.tag}"
                 if element.attrib:
                     attrs = " ".join(f'{k}="{v}"' for k, v in element.attrib.items())
                     text += f" {attrs}"
-                
-                if element.text and element.text.strip():
-                    text += f">{element.text.strip()}"
-                    if list(element):
-                        text += "\n"
-                        for child in element:
-                            text += xml_to_text(child, level + 1)
-                        text += f"{indent}</{element.tag}>\n"
-                    else:
-                        text += f"</{element.tag}>\n"
-                else:
-                    if list(element):
-                        text += ">\n"
-                        for child in element:
-                            text += xml_to_text(child, level + 1)
-                        text += f"{indent}</{element.tag}>\n"
-                    else:
-                        text += " />\n"
-                
                 return text
             
+            with FileProcessor._open_binary(file_path) as file:
+                for event, element in ET.iterparse(file, events=('start', 'end')):
+                    if event == 'start':
+                        if stack:
+                            # First child: the parent's opening tag and text are now known
+                            parent = stack[-1]
+                            if not parent[1]:
+                                parent_text = (parent[0].text or '').strip()
+                                parts.append(header(parent[0], len(stack) - 1))
+                                parts.append(f">{parent_text}\n" if parent_text else ">\n")
+                                parent[1] = True
+                            if len(stack) == 1:
+                                root_children += 1
+                        else:
+                            root_tag = element.tag
+                        stack.append([element, False])
+                    else:
+                        _, header_written = stack.pop()
+                        level = len(stack)
+                        if header_written:
+                            parts.append(f"{'  ' * level}</{element.tag}>\n")
+                        else:
+                            text = (element.text or '').strip()
+                            parts.append(header(element, level))
+                            parts.append(f">{text}</{element.tag}>\n" if text else " />\n")
+                        element.clear()
+            
             result = f"XML Document Analysis\n"
-            result += f"Root Element: {root.tag}\n"
-            result += f"Namespace: {root.tag.split('}')[0] + '}' if '}' in root.tag else 'None'}\n"
-            result += f"Children: {len(list(root))}\n\n"
+            result += f"Root Element: {root_tag}\n"
+            result += f"Namespace: {root_tag.split('}')[0] + '}' if '}' in root_tag else 'None'}\n"
+            result += f"Children: {root_children}\n\n"
             result += "Structure:\n"
-            result += xml_to_text(root)
+            result += ''.join(parts)
             
             return result
             
@@ -227,11 +317,11 @@ class FileProcessor:
     def extract_yaml_content(file_path: str) -> str:
         """Extract and analyze YAML content"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                data = yaml.safe_load(file)
+            with FileProcessor._open_text(file_path) as file:
+                data = yaml.load(file, Loader=YamlLoader)
             
             # Format YAML nicely
-            formatted_yaml = yaml.dump(data, default_flow_style=False, indent=2)
+            formatted_yaml = yaml.dump(data, Dumper=YamlDumper, default_flow_style=False, indent=2)
             
             result = f"YAML Document Analysis\n"
             result += f"Structure: {type(data).__name__}\n"
@@ -253,72 +343,96 @@ class FileProcessor:
     def extract_text_content(file_path: str) -> str:
         """Extract content from text files"""
         try:
-            encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-            
-            for encoding in encodings:
+            with FileProcessor._open_binary(file_path) as file:
+                raw = file.read()
+            
+            # Read once; try UTF-8 and then cp1252 (detection mistakes short Western
+            # European text for cp1250 and friends), detecting from a prefix only after that
+            try:
+                content = raw.decode('utf-8')
+            except UnicodeDecodeError:
                 try:
-                    with open(file_path, 'r', encoding=encoding) as file:
-                        content = file.read()
-                    
-                    # Add file analysis
-                    lines = content.split('\n')
-                    words = len(content.split())
-                    chars = len(content)
-                    
-                    result = f"Text Document Analysis\n"
-                    result += f"Lines: {len(lines)}\n"
-                    result += f"Words: {words}\n"
-                    result += f"Characters: {chars}\n\n"
-                    result += f"Content:\n{content}"
-                    
-                    return result
-                    
+                    content = raw.decode('cp1252')
                 except UnicodeDecodeError:
-                    continue
+                    best = charset_normalizer.from_bytes(raw[:65536]).best()
+                    content = raw.decode(best.encoding if best else 'latin-1', errors='replace')
+            
+            # Add file analysis
+            lines = content.split('\n')
+            words = len(content.split())
+            chars = len(content)
+            
+            result = f"Text Document Analysis\n"
+            result += f"Lines: {len(lines)}\n"
+            result += f"Words: {words}\n"
+            result += f"Characters: {chars}\n\n"
+            result += f"Content:\n{content}"
             
-            return "Unable to decode file with common encodings"
+            return result
             
         except Exception as e:
             logger.error(f"Error extracting text content: {e}")
             return f"Error reading text file: {str(e)}"
     
+    @staticmethod
+    def extract_content(source, extension: str) -> str:
+        """Extract content from a file path or raw bytes based on extension"""
+        if extension == 'pdf':
+            return FileProcessor.extract_pdf_content(source)
+        elif extension in ['html', 'htm']:
+            return FileProcessor.extract_html_content(source)
+        elif extension == 'json':
+            return FileProcessor.extract_json_content(source)
+        elif extension == 'csv':
+            return FileProcessor.extract_csv_content(source)
+        elif extension == 'xml':
+            return FileProcessor.extract_xml_content(source)
+        elif extension in ['yaml', 'yml']:
+            return FileProcessor.extract_yaml_content(source)
+        else:
+            # Default to text extraction for code files and other text files
+            return FileProcessor.extract_text_content(source)
+    
     @staticmethod
     def process_file(file_path: str) -> Tuple[str, dict]:
         """Process file and extract content based on type"""
         try:
             file_info = FileProcessor.get_file_info(file_path)
-            extension = file_info.get('extension', '').lower()
-            
-            if not FileProcessor.is_supported_file(file_info.get('filename', '')):
-                return f"❌ Unsupported file type: {extension}", file_info
-            
-            # Check file size
-            if file_info.get('size', 0) > Config.MAX_FILE_SIZE:
-                return "❌ File too large. Maximum size is 16MB.", file_info
-            
-            # Extract content based on file type
-            if extension == 'pdf':
-                content = FileProcessor.extract_pdf_content(file_path)
-            elif extension in ['html', 'htm']:
-                content = FileProcessor.extract_html_content(file_path)
-            elif extension == 'json':
-                content = FileProcessor.extract_json_content(file_path)
-            elif extension == 'csv':
-                content = FileProcessor.extract_csv_content(file_path)
-            elif extension == 'xml':
-                content = FileProcessor.extract_xml_content(file_path)
-            elif extension in ['yaml', 'yml']:
-                content = FileProcessor.extract_yaml_content(file_path)
-            else:
-                # Default to text extraction for code files and other text files
-                content = FileProcessor.extract_text_content(file_path)
-            
-            return content, file_info
-            
+            return FileProcessor._process(file_path, file_info)
         except Exception as e:
             logger.error(f"Error processing file: {e}")
             return f"❌ Error processing file: {str(e)}", {}
     
+    @staticmethod
+    def process_bytes(file_bytes: bytes, filename: str) -> Tuple[str, dict]:
+        """Process in-memory file bytes without writing them to disk"""
+        try:
+            mime_type, _ = mimetypes.guess_type(filename)
+            file_info = {
+                'filename': os.path.basename(filename),
+                'size': len(file_bytes),
+                'mime_type': mime_type,
+                'extension': os.path.splitext(filename)[1].lower()[1:]
+            }
+            return FileProcessor._process(file_bytes, file_info)
+        except Exception as e:
+            logger.error(f"Error processing file: {e}")
+            return f"❌ Error processing file: {str(e)}", {}
+    
+    @staticmethod
+    def _process(source, file_info: dict) -> Tuple[str, dict]:
+        """Validate file info and extract content from a path or bytes"""
+        extension = file_info.get('extension', '').lower()
+        
+        if not FileProcessor.is_supported_file(file_info.get('filename', '')):
+            return f"❌ Unsupported file type: {extension}", file_info
+        
+        # Check file size
+        if file_info.get('size', 0) > Config.MAX_FILE_SIZE:
+            return "❌ File too large. Maximum size is 16MB.", file_info
+        
+        return FileProcessor.extract_content(source, extension), file_info
+    
     @staticmethod
     def download_whatsapp_media(media_url: str, access_token: str) -> Optional[bytes]:
         """Download media file from WhatsApp"""
@@ -328,10 +442,17 @@ class FileProcessor:
                 'User-Agent': 'WhatsApp-Bot/1.0'
             }
             
-            response = requests.get(media_url, headers=headers, timeout=30)
-            response.raise_for_status()
-            
-            return response.content
+            with _session.get(media_url, headers=headers, timeout=30, stream=True) as response:
+                response.raise_for_status()
+                
+                buffer = bytearray()
+                for chunk in response.iter_content(chunk_size=65536):
+                    buffer.extend(chunk)
+                    if len(buffer) > Config.MAX_FILE_SIZE:
+                        logger.warning(f"Media exceeds {Config.MAX_FILE_SIZE} bytes, aborting download")
+                        return None
+            
+            return bytes(buffer)
             
         except Exception as e:
             logger.error(f"Error downloading media: {e}")
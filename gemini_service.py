@@ -1,7 +1,9 @@
-import json
+import io
+import orjson
 import logging
 import os
 import time
+from PIL import Image
 from google import genai
 from google.genai import types
 from pydantic import BaseModel
@@ -12,58 +14,96 @@ logger = logging.getLogger(__name__)
 # Initialize Gemini client
 client = genai.Client(api_key=Config.GEMINI_API_KEY)
 
+# System instructions are fixed after import, so build them once
+_CHAT_SYSTEM_INSTRUCTION = (
+    f"You are {Config.BOT_NAME}, a helpful, fun, and engaging WhatsApp AI assistant. "
+    "Your personality traits:\n"
+    "- Friendly and approachable with appropriate emojis 😊\n"
+    "- Professional yet conversational\n"
+    "- Knowledgeable across various topics\n"
+    "- Helpful in solving problems and answering questions\n"
+    "- Engaging and interactive\n"
+    "- Concise but informative responses\n"
+    "- Always maintain a positive and supportive tone\n\n"
+    "Guidelines:\n"
+    "- Keep responses under 300 words for WhatsApp\n"
+    "- Use emojis appropriately to enhance communication\n"
+    "- Offer follow-up questions when helpful\n"
+    "- If you can't help with something, explain why and suggest alternatives\n"
+    "- Remember this is a WhatsApp conversation, so be conversational"
+)
+
+_FILE_ANALYSIS_INSTRUCTION = (
+    "You are an expert file content analyzer. Analyze the provided file content and:\n"
+    "1. Summarize the main content and purpose\n"
+    "2. Identify key information, patterns, or insights\n"
+    "3. Highlight important sections or data\n"
+    "4. Suggest potential uses or next steps\n"
+    "5. Point out any issues, errors, or improvements\n\n"
+    "Keep your analysis clear, structured, and actionable. "
+    "Use bullet points and emojis for better readability in WhatsApp."
+)
+
+_IMAGE_ANALYSIS_INSTRUCTION = (
+    "You are an expert image analyzer. Analyze the provided image and:\n"
+    "1. Describe what you see in detail\n"
+    "2. Identify objects, people, text, or scenes\n"
+    "3. Explain the context or setting\n"
+    "4. Note colors, composition, and visual elements\n"
+    "5. Extract any text present in the image\n"
+    "6. Suggest what the image might be used for\n\n"
+    "Provide a comprehensive yet concise analysis suitable for WhatsApp. "
+    "Use emojis and bullet points for better formatting."
+)
+
+# Cap on extracted file text sent for analysis; longer content keeps its head and tail
+MAX_FILE_CONTENT_CHARS = 120_000
+
+# Largest image side sent to Gemini; bigger uploads are downscaled before sending
+MAX_IMAGE_SIDE = 1568
+_IMAGE_MIME_TYPES = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'WEBP': 'image/webp', 'GIF': 'image/gif'}
+
+def prepare_image(image_bytes: bytes):
+    """Return (bytes, mime_type) for an upload, downscaling oversized images to JPEG"""
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            mime_type = _IMAGE_MIME_TYPES.get(img.format)
+            if mime_type and max(img.size) <= MAX_IMAGE_SIDE:
+                return image_bytes, mime_type
+            
+            # JPEG has no alpha: flatten transparent areas onto white instead of black
+            if img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info:
+                rgba = img.convert('RGBA')
+                rgb = Image.new('RGB', rgba.size, (255, 255, 255))
+                rgb.paste(rgba, mask=rgba.getchannel('A'))
+            else:
+                rgb = img.convert('RGB')
+            
+            rgb.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE), Image.LANCZOS)
+            buffer = io.BytesIO()
+            rgb.save(buffer, 'JPEG', quality=85, optimize=True)
+            return buffer.getvalue(), 'image/jpeg'
+    except Exception as e:
+        logger.warning(f"Could not preprocess image, sending original: {e}")
+        return image_bytes, 'image/jpeg'
+
 class AIService:
     """AI service for handling Gemini interactions"""
     
     @staticmethod
     def get_chat_system_instruction():
         """System instruction for chat interactions"""
-        return (
-            f"You are {Config.BOT_NAME}, a helpful, fun, and engaging WhatsApp AI assistant. "
-            "Your personality traits:\n"
-            "- Friendly and approachable with appropriate emojis 😊\n"
-            "- Professional yet conversational\n"
-            "- Knowledgeable across various topics\n"
-            "- Helpful in solving problems and answering questions\n"
-            "- Engaging and interactive\n"
-            "- Concise but informative responses\n"
-            "- Always maintain a positive and supportive tone\n\n"
-            "Guidelines:\n"
-            "- Keep responses under 300 words for WhatsApp\n"
-            "- Use emojis appropriately to enhance communication\n"
-            "- Offer follow-up questions when helpful\n"
-            "- If you can't help with something, explain why and suggest alternatives\n"
-            "- Remember this is a WhatsApp conversation, so be conversational"
-        )
+        return _CHAT_SYSTEM_INSTRUCTION
     
     @staticmethod
     def get_file_analysis_instruction():
         """System instruction for file analysis"""
-        return (
-            "You are an expert file content analyzer. Analyze the provided file content and:\n"
-            "1. Summarize the main content and purpose\n"
-            "2. Identify key information, patterns, or insights\n"
-            "3. Highlight important sections or data\n"
-            "4. Suggest potential uses or next steps\n"
-            "5. Point out any issues, errors, or improvements\n\n"
-            "Keep your analysis clear, structured, and actionable. "
-            "Use bullet points and emojis for better readability in WhatsApp."
-        )
+        return _FILE_ANALYSIS_INSTRUCTION
     
     @staticmethod
     def get_image_analysis_instruction():
         """System instruction for image analysis"""
-        return (
-            "You are an expert image analyzer. Analyze the provided image and:\n"
-            "1. Describe what you see in detail\n"
-            "2. Identify objects, people, text, or scenes\n"
-            "3. Explain the context or setting\n"
-            "4. Note colors, composition, and visual elements\n"
-            "5. Extract any text present in the image\n"
-            "6. Suggest what the image might be used for\n\n"
-            "Provide a comprehensive yet concise analysis suitable for WhatsApp. "
-            "Use emojis and bullet points for better formatting."
-        )
+        return _IMAGE_ANALYSIS_INSTRUCTION
     
     @staticmethod
     def chat_response(message: str, user_context: dict = None) -> str:
@@ -100,6 +140,11 @@ class AIService:
         try:
             start_time = time.time()
             
+            if len(content) > MAX_FILE_CONTENT_CHARS:
+                half = MAX_FILE_CONTENT_CHARS // 2
+                omitted = len(content) - MAX_FILE_CONTENT_CHARS
+                content = f"{content[:half]}\n...[{omitted} chars truncated]...\n{content[-half:]}"
+            
             prompt = (
                 f"File: {filename}\n"
                 f"Type: {file_type}\n"
@@ -131,12 +176,13 @@ class AIService:
         try:
             start_time = time.time()
             
+            payload, mime_type = prepare_image(image_bytes)
             response = client.models.generate_content(
                 model=Config.AI_ANALYSIS_MODEL,
                 contents=[
                     types.Part.from_bytes(
-                        data=image_bytes,
-                        mime_type="image/jpeg"
+                        data=payload,
+                        mime_type=mime_type
                     ),
                     "Analyze this image in detail."
                 ],
@@ -213,7 +259,7 @@ def analyze_content_structured(content: str, content_type: str) -> AnalysisResul
         )
         
         if response.text:
-            data = json.loads(response.text)
+            data = orjson.loads(response.text)
             return AnalysisResult(**data)
         else:
             raise ValueError("Empty response from model")
@@ -0,0 +1,20 @@
+import multiprocessing
+import os
+import sys
+
+# Gunicorn configuration for production deployments
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+
+# Load the app (database engine, WhatsApp client) once in the master before forking.
+# --reload can't pick up changes to preloaded modules, so dev runs with it skip preloading.
+_reloading = "--reload" in sys.argv or "--reload" in os.environ.get("GUNICORN_CMD_ARGS", "").split()
+preload_app = not _reloading
+
+def post_fork(server, worker):
+    """Drop database connections inherited from the master process"""
+    from app import app, db
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -1,4 +1,8 @@
+import os
 from app import app
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    if os.environ.get("FLASK_ENV") == "development":
+        app.run(host="0.0.0.0", port=5000, debug=True)
+    else:
+        os.execvp("gunicorn", ["gunicorn", "-c", "gunicorn.conf.py", "main:app"])
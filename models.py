@@ -1,9 +1,57 @@
+import logging
 from app import db
 from datetime import datetime
-from sqlalchemy import func
+from sqlalchemy import func, inspect, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+logger = logging.getLogger(__name__)
+
+def insert_on_conflict(model):
+    """Build a dialect-specific INSERT that supports ON CONFLICT clauses"""
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+# Columns added after the initial schema; db.create_all() never alters existing tables
+_ADDED_COLUMNS = (
+    ('user', 'consecutive_failures', 'INTEGER NOT NULL DEFAULT 0'),
+)
+
+def upgrade_schema():
+    """Bring a database created with an older schema up to date (idempotent)"""
+    inspector = inspect(db.engine)
+    for table, column, ddl in _ADDED_COLUMNS:
+        if column in {existing['name'] for existing in inspector.get_columns(table)}:
+            continue
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+        except Exception as e:
+            # Another process may have added it first
+            if column not in {existing['name'] for existing in inspect(db.engine).get_columns(table)}:
+                raise
+            logger.debug("Column %s.%s added concurrently: %s", table, column, e)
+        else:
+            logger.info("Added column %s.%s", table, column)
+    
+    # Indexes declared in __table_args__ are likewise only created with new tables
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=db.engine, checkfirst=True)
+            except Exception as e:
+                # e.g. a unique index over rows that already contain duplicates
+                logger.warning("Could not create index %s: %s", index.name, e)
 
 class User(db.Model):
     """User model for WhatsApp users"""
+    __table_args__ = (
+        db.Index('ix_user_last_seen', 'last_seen'),
+        db.Index('ix_user_admin', 'id', postgresql_where=db.text('is_admin'), sqlite_where=db.text('is_admin')),
+        db.Index('ix_user_banned', 'id', postgresql_where=db.text('is_banned'), sqlite_where=db.text('is_banned')),
+        db.Index('ix_user_active_phone', 'is_banned', 'phone_number'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     phone_number = db.Column(db.String(20), unique=True, nullable=False)
     name = db.Column(db.String(100), nullable=True)
@@ -12,6 +60,7 @@ class User(db.Model):
     banned_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     banned_at = db.Column(db.DateTime, nullable=True)
     ban_reason = db.Column(db.String(256), nullable=True)
+    consecutive_failures = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_seen = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -23,6 +72,10 @@ class User(db.Model):
 
 class Group(db.Model):
     """Group model for WhatsApp groups"""
+    __table_args__ = (
+        db.Index('ix_group_is_active', 'is_active'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     group_id = db.Column(db.String(100), unique=True, nullable=False)
     name = db.Column(db.String(200), nullable=True)
@@ -38,6 +91,13 @@ class Group(db.Model):
 
 class Message(db.Model):
     """Message model for tracking messages"""
+    __table_args__ = (
+        db.Index('ix_message_created_at', 'created_at'),
+        db.Index('ix_message_is_command_command_name', 'is_command', 'command_name'),
+        db.Index('ix_message_message_type', 'message_type'),
+        db.Index('ix_message_user_created', 'user_id', 'created_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     message_id = db.Column(db.String(100), unique=True, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -51,8 +111,20 @@ class Message(db.Model):
     def __repr__(self):
         return f'<Message {self.message_id}>'
 
+class MessageDailyCount(db.Model):
+    """Incrementally maintained per-day message counts"""
+    date = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<MessageDailyCount {self.date}: {self.count}>'
+
 class AIRequest(db.Model):
     """AI request tracking"""
+    __table_args__ = (
+        db.Index('ix_airequest_user_created', 'user_id', 'created_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     request_type = db.Column(db.String(50), nullable=False)  # chat, image_analysis, file_analysis
@@ -86,10 +158,14 @@ class FileProcessing(db.Model):
 
 class BotStats(db.Model):
     """Bot statistics tracking"""
+    __table_args__ = (
+        db.Index('ix_botstats_date_metric', 'date', 'metric_name', unique=True),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     metric_name = db.Column(db.String(100), nullable=False)
     metric_value = db.Column(db.Integer, default=0)
-    date = db.Column(db.Date, default=datetime.utcnow().date())
+    date = db.Column(db.Date, default=lambda: datetime.utcnow().date())
     
     def __repr__(self):
         return f'<BotStats {self.metric_name}: {self.metric_value}>'
@@ -15,6 +15,7 @@ from .helpers import (
     get_mime_type,
     is_valid_url,
     truncate_text,
+    truncate_utf8,
     format_timestamp,
     calculate_age,
     extract_mentions,
@@ -38,6 +39,7 @@ __all__ = [
     'get_mime_type',
     'is_valid_url',
     'truncate_text',
+    'truncate_utf8',
     'format_timestamp',
     'calculate_age',
     'extract_mentions',
@@ -1,17 +1,31 @@
 import time
+import inspect
 import logging
-from functools import wraps
-from collections import defaultdict, deque
-from datetime import datetime, timedelta
-from typing import Callable, Dict, Any
+import threading
+from functools import wraps, lru_cache
+from typing import Callable, Dict, Any, List, Optional, Tuple, get_args
 from pywa import types
 from models import User
 from config import Config
 
 logger = logging.getLogger(__name__)
 
-# Rate limiting storage (in-memory for MVP)
-rate_limit_storage: Dict[str, deque] = defaultdict(deque)
+# Rate limiting storage (in-memory for MVP): user_id -> (tokens, last_refill),
+# sharded by user hash so concurrent users don't contend on one lock
+_RATE_LIMIT_SHARDS = 256
+rate_limit_storage: List[Dict[str, Tuple[float, float]]] = [{} for _ in range(_RATE_LIMIT_SHARDS)]
+_rate_limit_locks = [threading.Lock() for _ in range(_RATE_LIMIT_SHARDS)]
+
+_MESSAGE_TYPES = (types.Message, types.CallbackButton)
+
+def _find_message_index(func: Callable) -> Optional[int]:
+    """Return the position of the first parameter annotated as a message/callback"""
+    for index, param in enumerate(inspect.signature(func).parameters.values()):
+        annotation = param.annotation
+        candidates = get_args(annotation) or (annotation,)
+        if any(candidate in _MESSAGE_TYPES for candidate in candidates):
+            return index
+    return None
 
 def rate_limit(max_requests: int = None, window_seconds: int = 60):
     """
@@ -23,35 +37,44 @@ def rate_limit(max_requests: int = None, window_seconds: int = 60):
     """
     if max_requests is None:
         max_requests = Config.MAX_REQUESTS_PER_MINUTE
+    refill_rate = max_requests / window_seconds
     
     def decorator(func: Callable) -> Callable:
+        message_index = _find_message_index(func)
+        # Bind hot-path globals once; closure loads are cheaper than global + attribute lookups
+        message_types = _MESSAGE_TYPES
+        storage = rate_limit_storage
+        locks = _rate_limit_locks
+        monotonic = time.monotonic
+        
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # Extract user identifier from message
+            # Extract user identifier from message (annotated position first, then scan)
             user_id = None
-            for arg in args:
-                if isinstance(arg, types.Message):
-                    user_id = arg.from_user.wa_id
-                    break
-                elif isinstance(arg, types.CallbackButton):
-                    user_id = arg.from_user.wa_id
-                    break
+            if message_index is not None and message_index < len(args) and isinstance(args[message_index], message_types):
+                user_id = args[message_index].from_user.wa_id
+            else:
+                for arg in args:
+                    if isinstance(arg, message_types):
+                        user_id = arg.from_user.wa_id
+                        break
             
             if not user_id:
                 # If we can't identify the user, allow the request
                 return func(*args, **kwargs)
             
-            # Check rate limit
-            now = datetime.now()
-            cutoff_time = now - timedelta(seconds=window_seconds)
-            
-            # Clean old requests
-            user_requests = rate_limit_storage[user_id]
-            while user_requests and user_requests[0] < cutoff_time:
-                user_requests.popleft()
+            # Refill the user's token bucket for the time elapsed since the last request
+            shard = hash(user_id) & (_RATE_LIMIT_SHARDS - 1)
+            buckets = storage[shard]
+            with locks[shard]:
+                now = monotonic()
+                tokens, last_refill = buckets.get(user_id, (max_requests, now))
+                tokens = min(max_requests, tokens + (now - last_refill) * refill_rate)
+                allowed = tokens >= 1
+                buckets[user_id] = (tokens - 1 if allowed else tokens, now)
             
             # Check if limit exceeded
-            if len(user_requests) >= max_requests:
+            if not allowed:
                 logger.warning(f"Rate limit exceeded for user {user_id}")
                 
                 # Send rate limit message
@@ -63,9 +86,6 @@ def rate_limit(max_requests: int = None, window_seconds: int = 60):
                         break
                 return None
             
-            # Record this request
-            user_requests.append(now)
-            
             # Execute the function
             return func(*args, **kwargs)
         
@@ -85,7 +105,7 @@ def admin_required(func: Callable) -> Callable:
         for arg in args:
             if isinstance(arg, User):
                 user = arg
-            elif isinstance(arg, (types.Message, types.CallbackButton)):
+            elif isinstance(arg, _MESSAGE_TYPES):
                 message = arg
                 # Get user from database
                 from bot import get_or_create_user
@@ -125,28 +145,30 @@ def log_performance(include_args: bool = False):
     def decorator(func: Callable) -> Callable:
         @wraps(func)
         def wrapper(*args, **kwargs):
-            start_time = time.time()
+            start_time = time.perf_counter()
             function_name = func.__name__
             
             try:
-                # Log function start
-                if include_args:
-                    logger.debug(f"Starting {function_name} with args: {args[:2]}...")  # Limit args logging
-                else:
-                    logger.debug(f"Starting {function_name}")
+                # Log function start (skip building the message when DEBUG is off)
+                if logger.isEnabledFor(logging.DEBUG):
+                    if include_args:
+                        logger.debug(f"Starting {function_name} with args: {args[:2]}...")  # Limit args logging
+                    else:
+                        logger.debug(f"Starting {function_name}")
                 
                 # Execute function
                 result = func(*args, **kwargs)
                 
                 # Log successful completion
-                execution_time = time.time() - start_time
-                logger.info(f"Completed {function_name} in {execution_time:.3f}s")
+                if logger.isEnabledFor(logging.INFO):
+                    execution_time = time.perf_counter() - start_time
+                    logger.info(f"Completed {function_name} in {execution_time:.3f}s")
                 
                 return result
                 
             except Exception as e:
                 # Log error with execution time
-                execution_time = time.time() - start_time
+                execution_time = time.perf_counter() - start_time
                 logger.error(f"Error in {function_name} after {execution_time:.3f}s: {str(e)}")
                 raise
         
@@ -162,26 +184,27 @@ def retry(max_attempts: int = 3, delay: float = 1.0, backoff_factor: float = 2.0
         delay: Initial delay between retries in seconds
         backoff_factor: Multiplier for delay after each failed attempt
     """
+    # The back-off schedule only depends on the decorator arguments; None marks the last attempt
+    delays = tuple(delay * (backoff_factor ** i) for i in range(max_attempts - 1)) + (None,)
+    
     def decorator(func: Callable) -> Callable:
         @wraps(func)
         def wrapper(*args, **kwargs):
             last_exception = None
-            current_delay = delay
             
-            for attempt in range(max_attempts):
+            for attempt, current_delay in enumerate(delays):
                 try:
                     return func(*args, **kwargs)
                 except Exception as e:
                     last_exception = e
                     
-                    if attempt == max_attempts - 1:
+                    if current_delay is None:
                         # Last attempt failed
                         logger.error(f"Function {func.__name__} failed after {max_attempts} attempts: {str(e)}")
                         raise
                     
                     logger.warning(f"Attempt {attempt + 1} of {func.__name__} failed: {str(e)}. Retrying in {current_delay}s...")
                     time.sleep(current_delay)
-                    current_delay *= backoff_factor
             
             # Should never reach here, but just in case
             raise last_exception
@@ -197,49 +220,53 @@ def validate_input(validation_rules: Dict[str, Any]):
         validation_rules: Dictionary of parameter validation rules
     """
     def decorator(func: Callable) -> Callable:
+        # Resolve parameter names and rule values once at decoration time
+        param_names = tuple(inspect.signature(func).parameters)
+        compiled_rules = tuple(
+            (
+                param_name,
+                rules.get('required'),
+                rules.get('type'),
+                rules.get('min_length'),
+                rules.get('max_length'),
+                rules.get('validator'),
+                rules.get('error_message', f"Invalid value for parameter '{param_name}'"),
+            )
+            for param_name, rules in validation_rules.items()
+        )
+        
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # Get function parameter names
-            import inspect
-            sig = inspect.signature(func)
-            param_names = list(sig.parameters.keys())
-            
             # Combine args and kwargs into a single dict
-            all_params = {}
-            for i, arg in enumerate(args):
-                if i < len(param_names):
-                    all_params[param_names[i]] = arg
+            all_params = dict(zip(param_names, args))
             all_params.update(kwargs)
             
             # Validate each parameter
-            for param_name, rules in validation_rules.items():
+            for param_name, required, expected_type, min_length, max_length, validator, error_msg in compiled_rules:
                 if param_name not in all_params:
                     continue
                 
                 value = all_params[param_name]
                 
                 # Check required
-                if rules.get('required') and value is None:
+                if required and value is None:
                     raise ValueError(f"Parameter '{param_name}' is required")
                 
                 # Check type
-                if 'type' in rules and value is not None:
-                    expected_type = rules['type']
+                if expected_type is not None and value is not None:
                     if not isinstance(value, expected_type):
                         raise TypeError(f"Parameter '{param_name}' must be of type {expected_type.__name__}")
                 
                 # Check min/max length for strings
                 if isinstance(value, str) and value:
-                    if 'min_length' in rules and len(value) < rules['min_length']:
-                        raise ValueError(f"Parameter '{param_name}' must be at least {rules['min_length']} characters")
-                    if 'max_length' in rules and len(value) > rules['max_length']:
-                        raise ValueError(f"Parameter '{param_name}' must be at most {rules['max_length']} characters")
+                    if min_length is not None and len(value) < min_length:
+                        raise ValueError(f"Parameter '{param_name}' must be at least {min_length} characters")
+                    if max_length is not None and len(value) > max_length:
+                        raise ValueError(f"Parameter '{param_name}' must be at most {max_length} characters")
                 
                 # Check custom validator
-                if 'validator' in rules and value is not None:
-                    validator = rules['validator']
+                if validator is not None and value is not None:
                     if not validator(value):
-                        error_msg = rules.get('error_message', f"Invalid value for parameter '{param_name}'")
                         raise ValueError(error_msg)
             
             return func(*args, **kwargs)
@@ -247,38 +274,35 @@ def validate_input(validation_rules: Dict[str, Any]):
         return wrapper
     return decorator
 
-def cache_result(ttl_seconds: int = 300):
+def cache_result(ttl_seconds: int = 300, maxsize: int = 1024):
     """
-    Simple in-memory cache decorator with TTL
+    Simple in-memory LRU cache decorator with TTL
     
     Args:
         ttl_seconds: Time to live for cached results in seconds
+        maxsize: Maximum number of cached results before evicting the least recently used
     """
-    cache = {}
-    
     def decorator(func: Callable) -> Callable:
+        # The TTL is enforced by keying on a coarse time bucket: once the bucket
+        # rolls over, older entries simply miss and age out of the LRU
+        @lru_cache(maxsize=maxsize)
+        def cached(bucket: int, *args, **kwargs):
+            return func(*args, **kwargs)
+        
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # Create cache key from function name and arguments
-            cache_key = f"{func.__name__}:{hash(str(args) + str(sorted(kwargs.items())))}"
-            
-            # Check if we have a valid cached result
-            if cache_key in cache:
-                result, timestamp = cache[cache_key]
-                if time.time() - timestamp < ttl_seconds:
-                    logger.debug(f"Cache hit for {func.__name__}")
-                    return result
-                else:
-                    # Cache expired, remove it
-                    del cache[cache_key]
-            
-            # Execute function and cache result
-            result = func(*args, **kwargs)
-            cache[cache_key] = (result, time.time())
-            logger.debug(f"Cached result for {func.__name__}")
-            
-            return result
+            try:
+                return cached(int(time.monotonic() // ttl_seconds), *args, **kwargs)
+            except TypeError:
+                # Unhashable arguments bypass the cache; anything else came from func
+                try:
+                    hash((args, tuple(kwargs.items())))
+                except TypeError:
+                    return func(*args, **kwargs)
+                raise
         
+        wrapper.cache_info = cached.cache_info
+        wrapper.cache_clear = cached.cache_clear
         return wrapper
     return decorator
 
@@ -291,14 +315,15 @@ def sanitize_output(func: Callable) -> Callable:
         result = func(*args, **kwargs)
         
         if isinstance(result, str):
-            # Remove or escape potentially problematic characters
-            result = result.replace('\r\n', '\n')  # Normalize line endings
-            result = result.replace('\r', '\n')    # Normalize line endings
+            # Normalize line endings; most replies have no '\r', so skip both copies then
+            if '\r' in result:
+                result = result.replace('\r\n', '\n').replace('\r', '\n')
             
             # Limit message length for WhatsApp
-            if len(result) > 4096:
+            original_length = len(result)
+            if original_length > 4096:
                 result = result[:4090] + "..."
-                logger.warning(f"Message truncated in {func.__name__} - original length: {len(result)}")
+                logger.warning(f"Message truncated in {func.__name__} - original length: {original_length}")
         
         return result
     
@@ -317,7 +342,11 @@ def handle_exceptions(default_response: str = "❌ An error occurred. Please try
             try:
                 return func(*args, **kwargs)
             except Exception as e:
-                logger.error(f"Exception in {func.__name__}: {str(e)}", exc_info=True)
+                # Full tracebacks only when DEBUG logging is on
+                logger.error(
+                    "Exception in %s: %s: %s", func.__name__, type(e).__name__, e,
+                    exc_info=logger.isEnabledFor(logging.DEBUG)
+                )
                 
                 # Try to send error message to user
                 for arg in args:
@@ -4,12 +4,46 @@ import uuid
 import mimetypes
 import hashlib
 from datetime import datetime, timedelta
+from functools import lru_cache
 from urllib.parse import urlparse
 from typing import List, Dict, Any, Optional, Union
 import logging
 
 logger = logging.getLogger(__name__)
 
+_NON_DIGIT_RE = re.compile(r'[^\d]')
+_FILENAME_BAD_RE = re.compile(r'[<>:"/\\|?*]')
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+_MENTION_RE = re.compile(r'@(\w+)')
+_PHONE_MENTION_RE = re.compile(r'\+?[\d\s\-\(\)]{10,}')
+# Strips the separators _PHONE_MENTION_RE can match, leaving only digits
+_PHONE_SEPARATORS = str.maketrans('', '', '+-() \t\n\r\f\v')
+
+# Extension sets used by the is_*_file helpers
+_IMAGE_EXTENSIONS = frozenset({
+    'jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp', 'svg', 'ico', 'tiff', 'tga'
+})
+_DOCUMENT_EXTENSIONS = frozenset({
+    'pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx', 'txt', 'rtf', 'odt'
+})
+_CODE_EXTENSIONS = frozenset({
+    'py', 'js', 'html', 'css', 'java', 'cpp', 'c', 'php', 'rb', 'go', 
+    'rs', 'swift', 'kt', 'ts', 'jsx', 'tsx', 'vue', 'xml', 'json', 
+    'yaml', 'yml', 'sql', 'sh', 'bat', 'ps1'
+})
+
+# (seconds, unit) pairs for calculate_age, largest first
+_AGE_UNITS = (
+    (31536000, 'year'),
+    (2592000, 'month'),
+    (86400, 'day'),
+    (3600, 'hour'),
+    (60, 'minute'),
+)
+
+# Common markdown characters, each mapped to its backslash-escaped form
+_MARKDOWN_ESCAPES = str.maketrans({char: f'\\{char}' for char in '*_`[]()~>#+-=|{}.!'})
+
 def format_phone_number(phone: str) -> str:
     """
     Format phone number to WhatsApp standard format
@@ -24,7 +58,7 @@ def format_phone_number(phone: str) -> str:
         return ""
     
     # Remove all non-digit characters
-    digits_only = re.sub(r'[^\d]', '', phone)
+    digits_only = _NON_DIGIT_RE.sub('', phone)
     
     # Add country code if missing (assuming +234 for Nigeria)
     if len(digits_only) == 10:
@@ -48,7 +82,7 @@ def validate_phone_number(phone: str) -> bool:
         return False
     
     # Remove all non-digit characters
-    digits_only = re.sub(r'[^\d]', '', phone)
+    digits_only = _NON_DIGIT_RE.sub('', phone)
     
     # Check if it's a valid length (10-15 digits)
     return 10 <= len(digits_only) <= 15
@@ -67,7 +101,7 @@ def clean_filename(filename: str) -> str:
         return "unknown_file"
     
     # Remove or replace dangerous characters
-    cleaned = re.sub(r'[<>:"/\\|?*]', '_', filename)
+    cleaned = _FILENAME_BAD_RE.sub('_', filename)
     
     # Remove leading/trailing dots and spaces
     cleaned = cleaned.strip('. ')
@@ -115,7 +149,7 @@ def sanitize_input(text: str, max_length: int = 1000) -> str:
         return ""
     
     # Remove or escape HTML tags
-    text = re.sub(r'<[^>]+>', '', text)
+    text = _HTML_TAG_RE.sub('', text)
     
     # Remove excessive whitespace
     text = ' '.join(text.split())
@@ -168,9 +202,21 @@ def get_mime_type(filename: str) -> str:
     Returns:
         MIME type string
     """
-    mime_type, _ = mimetypes.guess_type(filename)
+    mime_type = _mime_for_ext(get_file_extension(filename))
+    if mime_type is None:
+        # Compound suffixes like .tar.gz need the full name
+        mime_type, _ = mimetypes.guess_type(filename)
     return mime_type or "application/octet-stream"
 
+@lru_cache(maxsize=256)
+def _mime_for_ext(ext: str) -> Optional[str]:
+    """Look up the MIME type for a lowercase extension (memoized)"""
+    if not ext:
+        return None
+    
+    mime_type, _ = mimetypes.guess_type(f"file.{ext}")
+    return mime_type
+
 def is_valid_url(url: str) -> bool:
     """
     Check if a string is a valid URL
@@ -204,6 +250,26 @@ def truncate_text(text: str, max_length: int = 100, suffix: str = "...") -> str:
     
     return text[:max_length - len(suffix)] + suffix
 
+def truncate_utf8(text: str, max_bytes: int) -> str:
+    """
+    Truncate text to a UTF-8 byte budget without splitting characters
+    
+    Args:
+        text: Text to truncate
+        max_bytes: Maximum encoded size in bytes
+        
+    Returns:
+        Truncated text
+    """
+    if not text or len(text) * 4 <= max_bytes:
+        return text
+    
+    encoded = text.encode('utf-8')
+    if len(encoded) <= max_bytes:
+        return text
+    
+    return encoded[:max_bytes].decode('utf-8', errors='ignore')
+
 def format_timestamp(timestamp: datetime, format_str: str = "%Y-%m-%d %H:%M:%S") -> str:
     """
     Format datetime timestamp
@@ -233,25 +299,14 @@ def calculate_age(created_at: datetime) -> str:
     if not created_at:
         return "Unknown"
     
-    now = datetime.utcnow()
-    diff = now - created_at
-    
-    if diff.days > 365:
-        years = diff.days // 365
-        return f"{years} year{'s' if years != 1 else ''} ago"
-    elif diff.days > 30:
-        months = diff.days // 30
-        return f"{months} month{'s' if months != 1 else ''} ago"
-    elif diff.days > 0:
-        return f"{diff.days} day{'s' if diff.days != 1 else ''} ago"
-    elif diff.seconds > 3600:
-        hours = diff.seconds // 3600
-        return f"{hours} hour{'s' if hours != 1 else ''} ago"
-    elif diff.seconds > 60:
-        minutes = diff.seconds // 60
-        return f"{minutes} minute{'s' if minutes != 1 else ''} ago"
-    else:
-        return "Just now"
+    total_seconds = (datetime.utcnow() - created_at).total_seconds()
+    
+    for unit_seconds, unit in _AGE_UNITS:
+        count = int(total_seconds // unit_seconds)
+        if count > 0:
+            return f"{count} {unit}{'s' if count != 1 else ''} ago"
+    
+    return "Just now"
 
 def extract_mentions(text: str) -> List[str]:
     """
@@ -267,15 +322,23 @@ def extract_mentions(text: str) -> List[str]:
         return []
     
     # Extract @username patterns
-    username_mentions = re.findall(r'@(\w+)', text)
-    
-    # Extract phone number patterns
-    phone_mentions = re.findall(r'\+?[\d\s\-\(\)]{10,}', text)
-    
-    # Clean phone numbers
-    cleaned_phones = [format_phone_number(phone) for phone in phone_mentions]
+    username_mentions = _MENTION_RE.findall(text)
+    
+    # Extract phone number patterns, cleaning and validating each in one pass
+    # (same result as format_phone_number + validate_phone_number)
+    phones = []
+    for phone in _PHONE_MENTION_RE.findall(text):
+        digits_only = phone.translate(_PHONE_SEPARATORS)
+        if not digits_only.isdigit():
+            # Unicode whitespace the translate table doesn't cover
+            digits_only = _NON_DIGIT_RE.sub('', digits_only)
+        
+        if len(digits_only) == 10:
+            phones.append("234" + digits_only)
+        elif 10 < len(digits_only) <= 15:
+            phones.append(digits_only)
     
-    return username_mentions + [phone for phone in cleaned_phones if validate_phone_number(phone)]
+    return username_mentions + phones
 
 def parse_command_args(text: str, prefix: str = "/") -> Dict[str, Any]:
     """
@@ -320,6 +383,20 @@ def hash_string(text: str) -> str:
     """
     return hashlib.sha256(text.encode('utf-8')).hexdigest()
 
+def hash_string_fast(text: str) -> str:
+    """
+    Create a short BLAKE2b hash of a string for cache keys and deduplication
+    
+    Use hash_string instead where a SHA-256 digest is required.
+    
+    Args:
+        text: Text to hash
+        
+    Returns:
+        32-character hexadecimal hash string
+    """
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
 def safe_int(value: Any, default: int = 0) -> int:
     """
     Safely convert value to integer
@@ -370,40 +447,50 @@ def chunk_text(text: str, chunk_size: int = 4000) -> List[str]:
         return [text]
     
     chunks = []
-    current_chunk = ""
+    parts = []  # pending pieces of the current chunk, joined only when flushed
+    current_len = 0
     
     # Split by lines first to maintain formatting
     lines = text.split('\n')
     
     for line in lines:
-        if len(current_chunk) + len(line) + 1 <= chunk_size:
-            if current_chunk:
-                current_chunk += '\n' + line
+        if current_len + len(line) + 1 <= chunk_size:
+            if current_len:
+                parts.append('\n')
+                parts.append(line)
+                current_len += len(line) + 1
             else:
-                current_chunk = line
+                parts = [line]
+                current_len = len(line)
         else:
-            if current_chunk:
-                chunks.append(current_chunk)
+            if current_len:
+                chunks.append(''.join(parts))
             
             # If single line is too long, split it
             if len(line) > chunk_size:
                 words = line.split(' ')
-                current_chunk = ""
+                parts = []
+                current_len = 0
                 for word in words:
-                    if len(current_chunk) + len(word) + 1 <= chunk_size:
-                        if current_chunk:
-                            current_chunk += ' ' + word
+                    if current_len + len(word) + 1 <= chunk_size:
+                        if current_len:
+                            parts.append(' ')
+                            parts.append(word)
+                            current_len += len(word) + 1
                         else:
-                            current_chunk = word
+                            parts = [word]
+                            current_len = len(word)
                     else:
-                        if current_chunk:
-                            chunks.append(current_chunk)
-                        current_chunk = word
+                        if current_len:
+                            chunks.append(''.join(parts))
+                        parts = [word]
+                        current_len = len(word)
             else:
-                current_chunk = line
+                parts = [line]
+                current_len = len(line)
     
-    if current_chunk:
-        chunks.append(current_chunk)
+    if current_len:
+        chunks.append(''.join(parts))
     
     return chunks
 
@@ -417,12 +504,8 @@ def is_image_file(filename: str) -> bool:
     Returns:
         True if image file, False otherwise
     """
-    image_extensions = {
-        'jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp', 'svg', 'ico', 'tiff', 'tga'
-    }
-    
     extension = get_file_extension(filename)
-    return extension in image_extensions
+    return extension in _IMAGE_EXTENSIONS
 
 def is_document_file(filename: str) -> bool:
     """
@@ -434,12 +517,8 @@ def is_document_file(filename: str) -> bool:
     Returns:
         True if document file, False otherwise
     """
-    document_extensions = {
-        'pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx', 'txt', 'rtf', 'odt'
-    }
-    
     extension = get_file_extension(filename)
-    return extension in document_extensions
+    return extension in _DOCUMENT_EXTENSIONS
 
 def is_code_file(filename: str) -> bool:
     """
@@ -451,14 +530,8 @@ def is_code_file(filename: str) -> bool:
     Returns:
         True if code file, False otherwise
     """
-    code_extensions = {
-        'py', 'js', 'html', 'css', 'java', 'cpp', 'c', 'php', 'rb', 'go', 
-        'rs', 'swift', 'kt', 'ts', 'jsx', 'tsx', 'vue', 'xml', 'json', 
-        'yaml', 'yml', 'sql', 'sh', 'bat', 'ps1'
-    }
-    
     extension = get_file_extension(filename)
-    return extension in code_extensions
+    return extension in _CODE_EXTENSIONS
 
 def get_file_category(filename: str) -> str:
     """
@@ -514,13 +587,7 @@ def escape_markdown(text: str) -> str:
     if not text:
         return ""
     
-    # Escape common markdown characters
-    escape_chars = ['*', '_', '`', '[', ']', '(', ')', '~', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
-    
-    for char in escape_chars:
-        text = text.replace(char, f'\\{char}')
-    
-    return text
+    return text.translate(_MARKDOWN_ESCAPES)
 
 def format_whatsapp_message(text: str, bold: bool = False, italic: bool = False, monospace: bool = False) -> str:
     """